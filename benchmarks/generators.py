@@ -0,0 +1,86 @@
+"""
+Seeded synthetic signed CLDs for benchmarking CLDAnalyzer.
+
+Every generator returns (variable_ids, triples) where triples are
+(source_id, target_id, RelationshipType) without self-loops or repeated
+edges, ready for CompactGraph.from_triples or POST /analysis/preview.
+The same arguments always produce the same diagram.
+"""
+import random
+from src.models.entities import RelationshipType
+from src.models.archetype_patterns import ARCHETYPE_PATTERNS
+from src.models.graph import POSITIVE
+
+GENERATORS = ('random', 'scale_free', 'planted')
+
+def _variable_ids(n):
+    return [f"v{i:05d}" for i in range(n)]
+
+def _polarity(rng, negative_ratio):
+    return RelationshipType.NEGATIVE if rng.random() < negative_ratio else RelationshipType.POSITIVE
+
+def random_cld(n, avg_degree=2.0, negative_ratio=0.4, seed=0):
+    """Erdős–Rényi style diagram: about n * avg_degree edges between uniform random pairs."""
+    rng = random.Random(seed)
+    variable_ids = _variable_ids(n)
+    target_edges = min(int(n * avg_degree), n * (n - 1))
+    edges = {}
+    while len(edges) < target_edges:
+        u, v = rng.randrange(n), rng.randrange(n)
+        if u != v and (u, v) not in edges:
+            edges[(u, v)] = _polarity(rng, negative_ratio)
+    return variable_ids, [(variable_ids[u], variable_ids[v], sign) for (u, v), sign in edges.items()]
+
+def scale_free_cld(n, links_per_node=2, reciprocity=0.3, negative_ratio=0.4, seed=0):
+    """
+    Preferential attachment diagram: each new variable links to
+    `links_per_node` existing ones picked by degree, in a random direction,
+    and a `reciprocity` share of links also get the reverse edge so hubs sit
+    on many loops.
+    """
+    rng = random.Random(seed)
+    variable_ids = _variable_ids(n)
+    edges = {}
+    endpoints = []  # every node once per incident edge, for degree-proportional picks
+    for v in range(1, n):
+        picks = {rng.choice(endpoints) if endpoints else 0 for _ in range(min(links_per_node, v))}
+        for u in picks:
+            source, target = (u, v) if rng.random() < 0.5 else (v, u)
+            edges[(source, target)] = _polarity(rng, negative_ratio)
+            if rng.random() < reciprocity:
+                edges[(target, source)] = _polarity(rng, negative_ratio)
+            endpoints.extend((u, v))
+    return variable_ids, [(variable_ids[u], variable_ids[v], sign) for (u, v), sign in edges.items()]
+
+def planted_cld(n, plants_per_archetype=1, avg_degree=1.5, negative_ratio=0.4, seed=0):
+    """
+    Random background diagram with every archetype pattern wired in
+    `plants_per_archetype` times on disjoint variables (as far as n allows),
+    so each detector has at least that many true matches.
+    """
+    rng = random.Random(seed)
+    variable_ids, triples = random_cld(n, avg_degree, negative_ratio, seed)
+    edges = {(source, target): sign for source, target, sign in triples}
+
+    free = list(variable_ids)
+    rng.shuffle(free)
+    for _ in range(plants_per_archetype):
+        for pattern in ARCHETYPE_PATTERNS:
+            if len(free) < len(pattern.roles):
+                break
+            role_vars = {role: free.pop() for role in pattern.roles}
+            for source_role, target_role, sign in pattern.edges:
+                edges[(role_vars[source_role], role_vars[target_role])] = (
+                    RelationshipType.POSITIVE if sign == POSITIVE else RelationshipType.NEGATIVE
+                )
+    return variable_ids, [(source, target, sign) for (source, target), sign in edges.items()]
+
+def generate(kind, n, seed=0):
+    """Diagram of the given generator kind and size."""
+    if kind == 'random':
+        return random_cld(n, seed=seed)
+    if kind == 'scale_free':
+        return scale_free_cld(n, seed=seed)
+    if kind == 'planted':
+        return planted_cld(n, plants_per_archetype=max(1, n // 200), seed=seed)
+    raise ValueError(f"Unknown generator {kind!r}. Must be one of: {list(GENERATORS)}")
@@ -0,0 +1,202 @@
+"""
+Micro-benchmarks for CLDAnalyzer on synthetic diagrams.
+
+    python -m benchmarks.run --sizes 10,100,500,2000 --output report.json
+    python -m benchmarks.run --baseline report.json --threshold 0.25
+    python -m benchmarks.run --sizes 500 --metrics metrics.txt
+
+Everything runs on in-memory CompactGraphs, so no database is needed. For
+each generator and size, every phase is timed over --repeat runs (min and
+median are reported), then run once more under tracemalloc for its peak
+memory. With --baseline, the exit status is 1 when a phase's min time grew
+by more than --threshold (a fraction) over the baseline report. --metrics
+writes the analyzer's phase histograms (as served on GET /metrics) after
+the run.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import islice
+from src.models.domain_logic import CLDAnalyzer, BoundedCycleSearch
+from src.models.archetype_patterns import ARCHETYPE_PATTERNS, PATTERN_MOTIFS, match_pattern
+from src.models.graph import CompactGraph
+from src.metrics import registry
+from .generators import GENERATORS, generate
+
+DEFAULT_SIZES = (10, 100, 500, 2000)
+# Allowed slowdown over the baseline, as a fraction of the baseline time
+DEFAULT_THRESHOLD = float(os.getenv("BENCHMARK_REGRESSION_THRESHOLD", 0.25))
+# Phases faster than this (seconds) in the baseline are too noisy to compare
+DEFAULT_NOISE_FLOOR = 0.002
+
+def _phases(variable_ids, triples, args):
+    """(phase name, callable returning an item count) for one diagram."""
+    graph = CompactGraph.from_triples(variable_ids, triples)
+    snapshot = graph.to_snapshot(len(variable_ids))
+    cycles = list(BoundedCycleSearch(graph, max_length=args.max_length, max_loops=args.max_loops))
+
+    phases = [
+        ('build_graph', lambda: CompactGraph.from_triples(variable_ids, triples).edge_count),
+        ('load_snapshot', lambda: CompactGraph.from_snapshot(snapshot)[0].edge_count),
+        ('loop_enumeration', lambda: sum(
+            1 for _ in BoundedCycleSearch(graph, max_length=args.max_length, max_loops=args.max_loops)
+        )),
+        ('loop_classification', lambda: len([
+            CLDAnalyzer._classify_cycle(graph, cycle, graph.n) for cycle in cycles
+        ])),
+        ('feedback_loops', lambda: len(CLDAnalyzer.find_feedback_loops(
+            graph, max_length=args.max_length, max_loops=args.max_loops
+        )[0])),
+        ('motif_census', lambda: sum(graph.motif_census().values())),
+        ('archetype_prefilter', lambda: sum(graph.motif_bounds(PATTERN_MOTIFS).values())),
+    ]
+    for pattern in ARCHETYPE_PATTERNS:
+        phases.append((
+            f"archetype:{pattern.archetype_type.name}",
+            lambda pattern=pattern: sum(1 for _ in islice(match_pattern(graph, pattern), args.max_per_type))
+        ))
+    phases.append(('archetypes', lambda: len(CLDAnalyzer.find_archetypes(
+        graph, max_per_type=args.max_per_type, max_total=args.max_total
+    )[0])))
+    return phases
+
+def _measure(run, repeat):
+    timings = []
+    items = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = run()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'items': items,
+        'min_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+def run_benchmarks(args):
+    results = []
+    for kind in args.generators:
+        for n in args.sizes:
+            variable_ids, triples = generate(kind, n, seed=args.seed)
+            for phase, run in _phases(variable_ids, triples, args):
+                result = {'generator': kind, 'variables': n, 'relationships': len(triples), 'phase': phase}
+                result.update(_measure(run, args.repeat))
+                results.append(result)
+                print(
+                    f"{kind:>10} n={n:<5} {phase:<40} {result['min_seconds'] * 1000:10.2f} ms"
+                    f" {result['peak_kib']:10.1f} KiB  items={result['items']}",
+                    file=sys.stderr
+                )
+    return {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'max_length': args.max_length,
+            'max_loops': args.max_loops,
+            'max_per_type': args.max_per_type,
+            'max_total': args.max_total,
+        },
+        'results': results,
+    }
+
+def find_regressions(report, baseline, threshold, noise_floor=DEFAULT_NOISE_FLOOR):
+    """Phases whose min time exceeds the baseline's by more than `threshold`."""
+    def key(result):
+        return result['generator'], result['variables'], result['phase']
+
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get(key(result))
+        if before is None or before['min_seconds'] < noise_floor:
+            continue
+        ratio = result['min_seconds'] / before['min_seconds']
+        if ratio > 1 + threshold:
+            regressions.append({
+                'generator': result['generator'],
+                'variables': result['variables'],
+                'phase': result['phase'],
+                'baseline_seconds': before['min_seconds'],
+                'min_seconds': result['min_seconds'],
+                'ratio': round(ratio, 3),
+            })
+    return regressions
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+def _generator_list(value):
+    kinds = [item for item in value.split(',') if item]
+    for kind in kinds:
+        if kind not in GENERATORS:
+            raise argparse.ArgumentTypeError(f"unknown generator {kind!r}, choose from {', '.join(GENERATORS)}")
+    return kinds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CLDAnalyzer on synthetic diagrams.")
+    parser.add_argument('--sizes', type=_int_list, default=list(DEFAULT_SIZES),
+                        help="comma-separated variable counts (default: 10,100,500,2000)")
+    parser.add_argument('--generators', type=_generator_list, default=list(GENERATORS),
+                        help="comma-separated generators: random, scale_free, planted")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per phase")
+    parser.add_argument('--max-length', type=int, default=8, help="loop length bound")
+    parser.add_argument('--max-loops', type=int, default=5000, help="loop count bound")
+    parser.add_argument('--max-per-type', type=int, default=200, help="matches kept per archetype")
+    parser.add_argument('--max-total', type=int, default=1000, help="archetype matches kept overall")
+    parser.add_argument('--output', help="write the JSON report to this file (default: stdout)")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown over the baseline as a fraction (default: 0.25)")
+    parser.add_argument('--noise-floor', type=float, default=DEFAULT_NOISE_FLOOR,
+                        help="ignore phases faster than this many seconds in the baseline")
+    parser.add_argument('--metrics', help="write the Prometheus metrics recorded during the run to this file")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        report['regressions'] = find_regressions(report, baseline, args.threshold, args.noise_floor)
+        for regression in report['regressions']:
+            print(
+                f"REGRESSION {regression['generator']} n={regression['variables']} {regression['phase']}: "
+                f"{regression['baseline_seconds'] * 1000:.2f} ms -> {regression['min_seconds'] * 1000:.2f} ms "
+                f"(x{regression['ratio']})",
+                file=sys.stderr
+            )
+        status = 1 if report['regressions'] else 0
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.metrics:
+        with open(args.metrics, 'w') as metrics_file:
+            metrics_file.write(registry.render())
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,7 +17,8 @@ def create_app():
         r"/*": {
             "origins": "*",
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization"],
+            "expose_headers": ["X-DB-Queries", "X-DB-Time"]
         }
     })
     
@@ -27,12 +28,25 @@ def create_app():
     
     db.init_app(app)
     
+    from .jobs import job_runner
+    job_runner.init_app(app)
+    
+    from . import migrations
+    migrations.init_app(app)
+    
+    from .instrumentation import db_instrumentation
+    db_instrumentation.init_app(app)
+    
+    from .metrics import request_metrics
+    request_metrics.init_app(app)
+    
     with app.app_context():
         # Import models to ensure they are registered with SQLAlchemy
         from .models.entities import (
-            User, Variable, CLD, Relationship, FeedbackLoop, Archetype,
+            User, Variable, CLD, Relationship, FeedbackLoop, Archetype, AnalysisJob,
             RelationshipType, LoopType, ArchetypeType
         )
+        from .migrations import run_migrations
 
         try:
             # Cria os tipos ENUM apenas se ainda não existirem (no schema public)
@@ -88,6 +102,9 @@ def create_app():
 
             # Cria as tabelas (só se não existirem)
             db.create_all()
+
+            # Colunas e índices adicionados depois da criação inicial das tabelas
+            run_migrations(db.session)
             print("✅ Database tables checked/created (no drop).")
 
         except Exception as e:
@@ -0,0 +1,121 @@
+import os
+import re
+import time
+import threading
+from collections import Counter
+from flask import g, request, current_app, has_request_context, jsonify
+
+# Set to 0 to turn the per-request query accounting off
+DB_INSTRUMENTATION = os.getenv("DB_INSTRUMENTATION", "1") == "1"
+# Warn when one request runs the same statement shape more than this many times
+N_PLUS_ONE_THRESHOLD = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", 10))
+# Serve the aggregated per-endpoint statistics on GET /debug/db-stats
+DB_STATS_ENDPOINT = os.getenv("DB_STATS_ENDPOINT", "0") == "1"
+
+# Bound parameter placeholders (qmark, pyformat and named styles)
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+_PLACEHOLDER_LIST = re.compile(r"\(\s*" + _PLACEHOLDER + r"(?:\s*,\s*" + _PLACEHOLDER + r")*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement):
+    """SQL text with whitespace collapsed and IN (...) lists of any length folded together."""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+class QueryInstrumentation:
+    """
+    Counts the SQL statements and database time of each request through
+    SQLAlchemy cursor events. Every response gets X-DB-Queries and X-DB-Time
+    (milliseconds) headers; a request that repeats one statement shape more
+    than N_PLUS_ONE_THRESHOLD times is logged as a likely N+1. Totals are
+    aggregated per endpoint in `stats`.
+    """
+
+    def __init__(self, app=None):
+        self.stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not DB_INSTRUMENTATION:
+            return
+        from sqlalchemy import event
+        from . import db
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        if DB_STATS_ENDPOINT:
+            app.add_url_rule('/debug/db-stats', 'db_stats', lambda: jsonify(self.endpoint_stats()))
+
+    # The start time lives on the statement's execution context: a statement
+    # that raises never reaches after_cursor_execute, and its context is
+    # dropped with it instead of leaving state on the pooled connection.
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start_time = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_start_time', None)
+        if started is None or not has_request_context() or 'db_queries' not in g:
+            return
+        elapsed = time.perf_counter() - started
+        g.db_queries += 1
+        g.db_time += elapsed
+        g.db_statements[statement_shape(statement)] += 1
+
+    def _start_request(self):
+        g.db_queries = 0
+        g.db_time = 0.0
+        g.db_statements = Counter()
+
+    def _finish_request(self, response):
+        if 'db_queries' not in g:
+            return response
+
+        response.headers['X-DB-Queries'] = str(g.db_queries)
+        response.headers['X-DB-Time'] = f"{g.db_time * 1000:.3f}"
+
+        endpoint = request.endpoint or 'unmatched'
+        repeated = [
+            (shape, count) for shape, count in g.db_statements.items()
+            if count > N_PLUS_ONE_THRESHOLD
+        ]
+        for shape, count in repeated:
+            current_app.logger.warning(
+                "Possible N+1 in %s %s: statement ran %d times: %s",
+                request.method, endpoint, count, shape[:300]
+            )
+
+        with self._lock:
+            stats = self.stats.setdefault(endpoint, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'db_time_ms': 0.0,
+                'n_plus_one_warnings': 0
+            })
+            stats['requests'] += 1
+            stats['queries'] += g.db_queries
+            stats['max_queries'] = max(stats['max_queries'], g.db_queries)
+            stats['db_time_ms'] += g.db_time * 1000
+            stats['n_plus_one_warnings'] += len(repeated)
+        return response
+
+    def endpoint_stats(self):
+        """Per-endpoint totals, with mean queries and DB time per request."""
+        with self._lock:
+            return {
+                endpoint: dict(
+                    stats,
+                    db_time_ms=round(stats['db_time_ms'], 3),
+                    mean_queries=round(stats['queries'] / stats['requests'], 2),
+                    mean_db_time_ms=round(stats['db_time_ms'] / stats['requests'], 3)
+                )
+                for endpoint, stats in self.stats.items()
+            }
+
+db_instrumentation = QueryInstrumentation()
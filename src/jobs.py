@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+import click
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask.cli import with_appcontext
+from . import db
+
+# 'thread': queued jobs run on an in-process thread pool.
+# 'worker': jobs are only queued; `flask --app main analysis-worker` runs them.
+JOB_MODE = os.getenv("ANALYSIS_JOB_MODE", "thread")
+# Analysis jobs run at the same time (per web process or worker command)
+JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", 2))
+# Seconds the worker command waits before looking for new jobs again
+WORKER_POLL_INTERVAL = float(os.getenv("ANALYSIS_WORKER_POLL_INTERVAL", 1.0))
+# Seconds between lease renewals of a running job, for as long as it runs
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("ANALYSIS_JOB_HEARTBEAT_INTERVAL", 30))
+# Seconds a RUNNING job may go without renewing its lease before it is
+# considered abandoned by a crashed worker; several heartbeat intervals
+JOB_LEASE_TIMEOUT = float(os.getenv("ANALYSIS_JOB_LEASE_TIMEOUT", 120))
+# Claims of an abandoned job before it is marked FAILED instead of requeued
+JOB_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", 2))
+
+class JobRunner:
+    """
+    Runs queued analysis jobs on a thread pool, each inside its own app
+    context (and so its own database session). Job state lives in the
+    analysis_jobs table, so no broker is needed: the web process runs jobs
+    in-process, or a local worker command polls the table for them.
+
+    Leftover jobs are only resumed by processes that run jobs: a web process
+    in thread mode when it serves its first request, and the worker command
+    on every poll. Other CLI commands (`flask migrate`) never pick them up.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._resumed = False
+        self._resume_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.cli.add_command(analysis_worker)
+        app.before_request(self._resume_once)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='analysis-job')
+        return self._executor
+
+    def submit(self, job_id):
+        """Hands a newly queued job to the in-process pool (no-op in worker mode)."""
+        if JOB_MODE == 'thread':
+            return self.executor.submit(self.run_job, job_id)
+        return None
+
+    def run_job(self, job_id):
+        from .viewmodels import JobViewModel
+        with self.app.app_context():
+            try:
+                return JobViewModel(db.session).run_job(job_id, heartbeat_interval=JOB_HEARTBEAT_INTERVAL)
+            except Exception as e:
+                print(f"Error running analysis job {job_id}: {str(e)}")
+                return False
+
+    def recover_stale(self):
+        """Requeues (or fails) RUNNING jobs left behind by a worker that stopped."""
+        from .models.repositories import JobRepository
+        requeued, failed = JobRepository.recover_stale_jobs(db.session, JOB_LEASE_TIMEOUT, JOB_MAX_ATTEMPTS)
+        if requeued or failed:
+            print(f"Recovered stale analysis jobs: {requeued} requeued, {failed} failed")
+
+    def run_pending(self):
+        """Runs the currently pending jobs on the pool and waits for them. Returns how many ran."""
+        from .models.repositories import JobRepository
+        with self.app.app_context():
+            self.recover_stale()
+            job_ids = JobRepository.get_pending_job_ids(db.session)
+        futures = [self.executor.submit(self.run_job, job_id) for job_id in job_ids]
+        wait(futures)
+        return sum(1 for future in futures if future.result())
+
+    def resume_pending(self):
+        """Queues jobs left PENDING or abandoned RUNNING by a previous process (thread mode only)."""
+        if JOB_MODE != 'thread':
+            return
+        from .models.repositories import JobRepository
+        self.recover_stale()
+        for job_id in JobRepository.get_pending_job_ids(db.session):
+            self.submit(job_id)
+
+    def _resume_once(self):
+        """before_request hook: the first request of a web process resumes the leftover jobs."""
+        if self._resumed:
+            return
+        with self._resume_lock:
+            if self._resumed:
+                return
+            self._resumed = True
+        try:
+            self.resume_pending()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error resuming analysis jobs: {str(e)}")
+
+job_runner = JobRunner()
+
+@click.command('analysis-worker')
+@click.option('--once', is_flag=True, help='Run the pending jobs and exit.')
+@with_appcontext
+def analysis_worker(once):
+    """Runs queued analysis jobs on this host."""
+    print(f"Analysis worker started with {JOB_WORKERS} threads")
+    while True:
+        ran = job_runner.run_pending()
+        if ran:
+            print(f"Analysis worker ran {ran} job(s)")
+        if once:
+            break
+        time.sleep(WORKER_POLL_INTERVAL)
@@ -0,0 +1,268 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Set to 0 to stop serving GET /metrics (metrics are still recorded)
+METRICS_ENDPOINT = os.getenv("METRICS_ENDPOINT", "1") == "1"
+
+# Default histogram buckets, in seconds
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Buckets for counted quantities (cycles, statements)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """Base of the registry metrics: one value (or bucket set) per label combination."""
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Gauge(_Metric):
+    """
+    Gauge set explicitly, or read at render time from `collect`, a callable
+    returning {label values tuple: value}.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.collect is not None:
+            items = sorted(self.collect().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock seconds spent in the with block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None):
+        return self._register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+# HTTP
+HTTP_REQUESTS = registry.counter(
+    'http_requests', 'HTTP requests served.', ('method', 'route', 'status')
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency.', ('method', 'route')
+)
+HTTP_REQUEST_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'SQL statements run per HTTP request.', ('method', 'route'), COUNT_BUCKETS
+)
+
+# Analysis (recorded by CLDAnalyzer and CLDViewModel, in and out of Flask)
+ANALYSIS_GRAPH_BUILD_SECONDS = registry.histogram(
+    'cld_analysis_graph_build_seconds', 'Time to build the compact graph of a CLD.'
+)
+ANALYSIS_GRAPH_LOAD_SECONDS = registry.histogram(
+    'cld_analysis_graph_load_seconds', 'Time to decode the stored graph snapshot of a CLD.'
+)
+ANALYSIS_LOOP_SEARCH_SECONDS = registry.histogram(
+    'cld_analysis_loop_search_seconds', 'Time to enumerate and classify the feedback loops of a CLD.'
+)
+ANALYSIS_CYCLES_ENUMERATED = registry.histogram(
+    'cld_analysis_cycles_enumerated', 'Distinct feedback loops found per loop search.', (), COUNT_BUCKETS
+)
+ANALYSIS_CLASSIFICATION_SECONDS = registry.histogram(
+    'cld_analysis_loop_classification_seconds', 'Time spent classifying loops per loop search.'
+)
+ANALYSIS_ARCHETYPE_DETECTOR_SECONDS = registry.histogram(
+    'cld_analysis_archetype_detector_seconds', 'Time to match one archetype pattern.', ('archetype',)
+)
+ANALYSIS_PERSIST_SECONDS = registry.histogram(
+    'cld_analysis_persist_seconds', 'Time to write analysis results.', ('analysis',)
+)
+ANALYSIS_RESULTS = registry.counter(
+    'cld_analysis_results', 'Analyses by where the results came from (stored, cache or computed).',
+    ('analysis', 'source')
+)
+
+class RequestMetrics:
+    """Records HTTP metrics per blueprint route and serves GET /metrics."""
+
+    def init_app(self, app):
+        from flask import g, request
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            started = g.pop('metrics_started', None)
+            if started is None:
+                return response
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            if route == '/metrics':
+                return response
+            HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route)
+            if 'db_queries' in g:
+                HTTP_REQUEST_DB_QUERIES.observe(g.db_queries, method=request.method, route=route)
+            return response
+
+        with app.app_context():
+            self._register_pool_gauges()
+
+        if METRICS_ENDPOINT:
+            app.add_url_rule('/metrics', 'metrics', self.serve)
+
+    @staticmethod
+    def serve():
+        from flask import Response
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @staticmethod
+    def _register_pool_gauges():
+        from . import db
+        pool = db.engine.pool
+
+        def pool_value(method):
+            def collect():
+                # SQLite's StaticPool and NullPool have no sizing to report
+                read = getattr(pool, method, None)
+                return {(): read()} if read is not None else {}
+            return collect
+
+        for name, method, documentation in (
+            ('db_pool_size', 'size', 'Configured size of the database connection pool.'),
+            ('db_pool_checked_out', 'checkedout', 'Database connections currently in use.'),
+            ('db_pool_checked_in', 'checkedin', 'Idle database connections in the pool.'),
+            ('db_pool_overflow', 'overflow', 'Connections open beyond the pool size.'),
+        ):
+            if registry.get(name) is None:
+                registry.gauge(name, documentation, collect=pool_value(method))
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,185 @@
+"""
+Versioned schema migrations.
+
+db.create_all() only creates missing tables, so columns and indexes added
+to existing tables ship here instead. Each migration has a version, a
+description and the SQL statements it runs; the versions already applied
+are recorded in schema_migrations, and every pending migration runs in its
+own transaction in version order. Statements are written to be safe on a
+database freshly built by create_all (IF NOT EXISTS), where they find the
+columns and indexes already in place.
+
+Migrations run at startup and with `flask --app main migrate`
+(`--status` lists them without applying anything).
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+# Held while migrating so processes starting together don't race
+MIGRATION_LOCK_ID = 7219301
+
+MIGRATIONS = [
+    (1, "Order of variables along feedback loops", [
+        "ALTER TABLE feedback_loop_variables ADD COLUMN IF NOT EXISTS position INTEGER",
+    ]),
+    (2, "Fingerprints of stored analysis results", [
+        """
+        ALTER TABLE clds
+            ADD COLUMN IF NOT EXISTS feedback_loops_fingerprint VARCHAR(64),
+            ADD COLUMN IF NOT EXISTS feedback_loops_truncated BOOLEAN DEFAULT FALSE,
+            ADD COLUMN IF NOT EXISTS archetypes_fingerprint VARCHAR(64),
+            ADD COLUMN IF NOT EXISTS archetypes_truncated BOOLEAN DEFAULT FALSE
+        """,
+    ]),
+    (3, "CLD summary counters", [
+        """
+        ALTER TABLE clds
+            ADD COLUMN IF NOT EXISTS variable_count INTEGER,
+            ADD COLUMN IF NOT EXISTS relationship_count INTEGER,
+            ADD COLUMN IF NOT EXISTS reinforcing_loop_count INTEGER,
+            ADD COLUMN IF NOT EXISTS balancing_loop_count INTEGER,
+            ADD COLUMN IF NOT EXISTS archetype_count INTEGER,
+            ADD COLUMN IF NOT EXISTS last_analyzed_at TIMESTAMP
+        """,
+        # Counts of the CLDs created before the columns existed
+        """
+        UPDATE clds SET
+            variable_count = (SELECT COUNT(*) FROM cld_variables cv WHERE cv.cld_id = clds.id),
+            relationship_count = (SELECT COUNT(*) FROM relationships r WHERE r.cld_id = clds.id),
+            reinforcing_loop_count = (
+                SELECT COUNT(*) FROM feedback_loops f WHERE f.cld_id = clds.id AND f.type = 'REINFORCING'
+            ),
+            balancing_loop_count = (
+                SELECT COUNT(*) FROM feedback_loops f WHERE f.cld_id = clds.id AND f.type = 'BALANCING'
+            ),
+            archetype_count = (SELECT COUNT(*) FROM archetypes a WHERE a.cld_id = clds.id)
+        WHERE variable_count IS NULL
+        """,
+    ]),
+    (4, "Indexes on the foreign keys used by repository queries", [
+        "CREATE INDEX IF NOT EXISTS ix_clds_user_id ON clds (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_variables_user_id ON variables (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_relationships_cld_id ON relationships (cld_id)",
+        "CREATE INDEX IF NOT EXISTS ix_relationships_source_id ON relationships (source_id)",
+        "CREATE INDEX IF NOT EXISTS ix_relationships_target_id ON relationships (target_id)",
+        "CREATE INDEX IF NOT EXISTS ix_feedback_loops_cld_id ON feedback_loops (cld_id)",
+        "CREATE INDEX IF NOT EXISTS ix_archetypes_cld_id ON archetypes (cld_id)",
+        "CREATE INDEX IF NOT EXISTS ix_cld_variables_variable_id ON cld_variables (variable_id)",
+        "CREATE INDEX IF NOT EXISTS ix_feedback_loop_variables_variable_id ON feedback_loop_variables (variable_id)",
+        "CREATE INDEX IF NOT EXISTS ix_archetype_variables_variable_id ON archetype_variables (variable_id)",
+    ]),
+    (5, "Unique variable names per user", [
+        # Rewrites user data: existing duplicates keep their first name and the
+        # others get their id appended. Every renamed variable is printed.
+        """
+        UPDATE variables SET name = variables.name || ' (' || LEFT(variables.id, 8) || ')'
+        FROM (
+            SELECT id, name, ROW_NUMBER() OVER (PARTITION BY user_id, name ORDER BY id) AS duplicate
+            FROM variables
+        ) ranked
+        WHERE ranked.id = variables.id AND ranked.duplicate > 1
+        RETURNING variables.id, variables.user_id, ranked.name AS old_name, variables.name AS new_name
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_variables_user_id_name ON variables (user_id, name)",
+    ]),
+    (6, "Keyset pagination indexes for the CLD and variable listings", [
+        "CREATE INDEX IF NOT EXISTS ix_clds_user_id_name_id ON clds (user_id, name, id)",
+        "CREATE INDEX IF NOT EXISTS ix_clds_user_id_date_id ON clds (user_id, date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_variables_user_id_name_id ON variables (user_id, name, id)",
+        # Covered by the indexes above, which start with user_id
+        "DROP INDEX IF EXISTS ix_clds_user_id",
+        "DROP INDEX IF EXISTS ix_variables_user_id",
+    ]),
+    # Existing CLDs get their snapshot written by the first analysis that needs it
+    (7, "Compact graph snapshot of each CLD", [
+        "ALTER TABLE clds ADD COLUMN IF NOT EXISTS graph_snapshot BYTEA",
+    ]),
+    # Existing loops count as unbounded; bounded ones no longer match their fingerprint and are recomputed
+    (8, "Bounds of the stored feedback loop analysis", [
+        """
+        ALTER TABLE clds
+            ADD COLUMN IF NOT EXISTS feedback_loops_max_length INTEGER,
+            ADD COLUMN IF NOT EXISTS feedback_loops_max_loops INTEGER
+        """,
+    ]),
+    (9, "Lease of running analysis jobs", [
+        """
+        ALTER TABLE analysis_jobs
+            ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0
+        """,
+    ]),
+    (10, "Name prefix indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_clds_user_id_lower_name ON clds (user_id, lower(name) text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_variables_user_id_lower_name ON variables (user_id, lower(name) text_pattern_ops)",
+    ]),
+]
+
+def _ensure_migrations_table(session):
+    session.execute(text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description VARCHAR NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """))
+    session.commit()
+
+def applied_versions(session):
+    _ensure_migrations_table(session)
+    return set(session.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+def run_migrations(session):
+    """
+    Applies the pending migrations in version order. Returns the versions
+    applied. Rows returned by a statement (RETURNING) are printed once its
+    migration is committed, so data a migration rewrites is on record.
+    """
+    _ensure_migrations_table(session)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        try:
+            session.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {'lock_id': MIGRATION_LOCK_ID})
+            # Checked under the lock: another process may have just applied it
+            done = session.execute(
+                text("SELECT 1 FROM schema_migrations WHERE version = :version"), {'version': version}
+            ).first()
+            if done:
+                session.commit()
+                continue
+            changed = []
+            for statement in statements:
+                result = session.execute(text(statement))
+                if result.returns_rows:
+                    changed.extend(dict(row) for row in result.mappings())
+            session.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                {'version': version, 'description': description}
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+        for row in changed:
+            print(f"  migration {version} changed {row}")
+        applied.append(version)
+    return applied
+
+def init_app(app):
+    app.cli.add_command(migrate)
+
+@click.command('migrate')
+@click.option('--status', is_flag=True, help='List the migrations and whether they are applied.')
+@with_appcontext
+def migrate(status):
+    """Applies pending schema migrations."""
+    from . import db
+    if status:
+        applied = applied_versions(db.session)
+        for version, description, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in applied else 'pending':<8} {description}")
+        return
+    applied = run_migrations(db.session)
+    print(f"Applied {len(applied)} migration(s)" if applied else "Database schema is up to date")
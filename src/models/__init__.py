@@ -5,14 +5,21 @@ from .entities import (
     Relationship, 
     FeedbackLoop, 
     Archetype,
+    AnalysisJob,
     RelationshipType,
     LoopType,
-    ArchetypeType
+    ArchetypeType,
+    JobStatus
 )
 from .domain_logic import CLDAnalyzer
+from .graph import CompactGraph
+from .archetype_patterns import ArchetypePattern, ARCHETYPE_PATTERNS
+from .analysis_cache import AnalysisCache
 from .repositories import (
     UserRepository,
     VariableRepository,
     CLDRepository,
-    RelationshipRepository
+    RelationshipRepository,
+    AnalysisRepository,
+    JobRepository
 ) 
\ No newline at end of file
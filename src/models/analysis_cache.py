@@ -0,0 +1,60 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Total size of the cached results, counted in variable references
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", 200000))
+
+class AnalysisCache:
+    """
+    In-process LRU of analysis results keyed by CLD fingerprint (see
+    CLDAnalyzer.fingerprint). Values are (results, truncated) pairs where
+    results is a list of (type, variable ids). Least recently used entries
+    are evicted once the total size of the cached results exceeds `max_size`.
+    """
+
+    def __init__(self, max_size=ANALYSIS_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(results):
+        return 1 + sum(len(variable_ids) for _, variable_ids in results)
+
+    def get(self, fingerprint):
+        """Returns the cached (results, truncated) pair, or None."""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            self._entries.move_to_end(fingerprint)
+            results, truncated, _ = entry
+            return [(result_type, list(variable_ids)) for result_type, variable_ids in results], truncated
+
+    def put(self, fingerprint, results, truncated):
+        results = tuple((result_type, tuple(variable_ids)) for result_type, variable_ids in results)
+        entry_size = self._entry_size(results)
+        if entry_size > self.max_size:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(fingerprint, None)
+            if previous is not None:
+                self.size -= previous[2]
+            self._entries[fingerprint] = (results, truncated, entry_size)
+            self.size += entry_size
+            while self.size > self.max_size:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+analysis_cache = AnalysisCache()
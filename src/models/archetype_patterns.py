@@ -0,0 +1,226 @@
+from .entities import ArchetypeType
+from .graph import CompactGraph, POSITIVE, NEGATIVE
+
+class ArchetypePattern:
+    """
+    Declarative wiring of a system archetype.
+        roles : role names, in the order matched variables are reported
+        edges : (source role, target role, polarity) links the roles must have
+    Every role is played by a distinct variable. `motifs` is the signed motif
+    census of the pattern itself: a graph containing the pattern has at least
+    as many of each motif.
+    """
+
+    def __init__(self, archetype_type, roles, edges):
+        self.archetype_type = archetype_type
+        self.roles = tuple(roles)
+        self.edges = tuple(edges)
+        self.motifs = CompactGraph.from_triples(self.roles, self.edges).motif_census()
+
+    def could_match(self, census):
+        """
+        False when a graph with this motif census cannot contain the pattern.
+        `census` only needs the motifs the pattern has (see motif_bounds).
+        """
+        return all(census[name] >= count for name, count in self.motifs.items() if count)
+
+# Canonical patterns (no explicit delays modeled).
+ARCHETYPE_PATTERNS = (
+    # Problem Symptom (PS) <-> Symptomatic Solution (SS), PS <-> Fundamental
+    # Solution (FS), and a Side-effect (SE) of SS undermining FS.
+    ArchetypePattern(
+        ArchetypeType.SHIFTING_THE_BURDEN,
+        roles=('PS', 'SS', 'FS', 'SE'),
+        edges=(
+            ('PS', 'SS', POSITIVE), ('SS', 'PS', NEGATIVE),
+            ('PS', 'FS', POSITIVE), ('FS', 'PS', NEGATIVE),
+            ('SS', 'SE', POSITIVE), ('SE', 'FS', NEGATIVE),
+        ),
+    ),
+    # Short balancing loop between Problem Symptom (PS) and Fix (F), with an
+    # Unintended Consequence (UC) of the fix reinforcing the problem.
+    ArchetypePattern(
+        ArchetypeType.FIXES_THAT_FAIL,
+        roles=('PS', 'F', 'UC'),
+        edges=(
+            ('PS', 'F', POSITIVE), ('F', 'PS', NEGATIVE),
+            ('F', 'UC', POSITIVE), ('UC', 'PS', POSITIVE),
+        ),
+    ),
+    # R1: Efforts (E) <-> Performance (P); B2: P <-> Limiting Action (LA),
+    # driven by a Constraint (C).
+    ArchetypePattern(
+        ArchetypeType.LIMITS_TO_SUCCESS,
+        roles=('E', 'P', 'LA', 'C'),
+        edges=(
+            ('E', 'P', POSITIVE), ('P', 'E', POSITIVE),
+            ('P', 'LA', POSITIVE), ('LA', 'P', NEGATIVE),
+            ('C', 'LA', POSITIVE),
+        ),
+    ),
+    # Gap central to both loops:
+    # B1: Actual (A) -> Gap -> Corrective Action (CA) -> A
+    # B2: Goal (G) -> Gap -> Pressure to Lower Goal (PLG) -> G
+    ArchetypePattern(
+        ArchetypeType.DRIFTING_GOALS,
+        roles=('G', 'A', 'GAP', 'CA', 'PLG'),
+        edges=(
+            ('G', 'GAP', POSITIVE), ('A', 'GAP', NEGATIVE),
+            ('GAP', 'CA', POSITIVE), ('CA', 'A', POSITIVE),
+            ('GAP', 'PLG', POSITIVE), ('PLG', 'G', NEGATIVE),
+        ),
+    ),
+    # R1: Growth Effort (E) <-> Demand (D)
+    # B2: D <-> Impact of Limiting Factor (ILF)
+    # B3: ILF and Performance Standard (PS) -> Perceived Need to Invest (PNI)
+    #     -> Investment in Capacity (IC) -> Capacity (C) -| ILF
+    ArchetypePattern(
+        ArchetypeType.GROWTH_AND_UNDERINVESTMENT,
+        roles=('E', 'D', 'ILF', 'PNI', 'IC', 'C', 'PS'),
+        edges=(
+            ('E', 'D', POSITIVE), ('D', 'E', POSITIVE),
+            ('D', 'ILF', POSITIVE), ('ILF', 'D', NEGATIVE),
+            ('ILF', 'PNI', POSITIVE), ('PS', 'PNI', POSITIVE),
+            ('PNI', 'IC', POSITIVE), ('IC', 'C', POSITIVE),
+            ('C', 'ILF', NEGATIVE),
+        ),
+    ),
+    # Two competing reinforcing loops sharing the allocation variable (A):
+    # R1: A -> Resources to A (RA) -> Success of A (SA) -> A
+    # R2: A -| Resources to B (RB) -> Success of B (SB) -| A
+    ArchetypePattern(
+        ArchetypeType.SUCCESS_TO_THE_SUCCESSFUL,
+        roles=('A', 'RA', 'SA', 'RB', 'SB'),
+        edges=(
+            ('A', 'RA', POSITIVE), ('RA', 'SA', POSITIVE), ('SA', 'A', POSITIVE),
+            ('A', 'RB', NEGATIVE), ('RB', 'SB', POSITIVE), ('SB', 'A', NEGATIVE),
+        ),
+    ),
+    # Center variable Q = "Quality of A's Position Relative to B's"
+    # B1: Q -| Threat to A (TA) -> Activity of A (ACTA) -> Result of A (RESA) -> Q
+    # B2: Q -> Threat to B (TB) -> Activity of B (ACTB) -> Result of B (RESB) -| Q
+    ArchetypePattern(
+        ArchetypeType.ESCALATION,
+        roles=('Q', 'TA', 'ACTA', 'RESA', 'TB', 'ACTB', 'RESB'),
+        edges=(
+            ('Q', 'TA', NEGATIVE), ('TA', 'ACTA', POSITIVE),
+            ('ACTA', 'RESA', POSITIVE), ('RESA', 'Q', POSITIVE),
+            ('Q', 'TB', POSITIVE), ('TB', 'ACTB', POSITIVE),
+            ('ACTB', 'RESB', POSITIVE), ('RESB', 'Q', NEGATIVE),
+        ),
+    ),
+    # Two actors draw from a shared commons:
+    # R1/R2: each Activity (A_ACT, B_ACT) <-> its Net Gains (A_NG, B_NG)
+    # Activities -> Total Activity -| Gain per Individual (GAIN) -| Activities,
+    # GAIN -> Net Gains, and a Resource Limit (RL) -> GAIN.
+    ArchetypePattern(
+        ArchetypeType.TRAGEDY_OF_THE_COMMONS,
+        roles=('TOTAL', 'GAIN', 'RL', 'A_ACT', 'A_NG', 'B_ACT', 'B_NG'),
+        edges=(
+            ('TOTAL', 'GAIN', NEGATIVE), ('RL', 'GAIN', POSITIVE),
+            ('GAIN', 'A_ACT', NEGATIVE), ('A_ACT', 'TOTAL', POSITIVE),
+            ('A_ACT', 'A_NG', POSITIVE), ('A_NG', 'A_ACT', POSITIVE), ('GAIN', 'A_NG', POSITIVE),
+            ('GAIN', 'B_ACT', NEGATIVE), ('B_ACT', 'TOTAL', POSITIVE),
+            ('B_ACT', 'B_NG', POSITIVE), ('B_NG', 'B_ACT', POSITIVE), ('GAIN', 'B_NG', POSITIVE),
+        ),
+    ),
+)
+
+# Most of each motif any pattern needs: the counts CompactGraph.motif_bounds
+# must reach for ArchetypePattern.could_match to be decided
+PATTERN_MOTIFS = {
+    name: max(pattern.motifs[name] for pattern in ARCHETYPE_PATTERNS)
+    for name in ARCHETYPE_PATTERNS[0].motifs
+    if any(pattern.motifs[name] for pattern in ARCHETYPE_PATTERNS)
+}
+
+def match_pattern(graph, pattern, node_limit=None):
+    """
+    Backtracking subgraph matcher. Yields one tuple of node indices (in
+    pattern.roles order) per distinct variable set wired like `pattern`.
+    Roles are assigned one at a time; candidates for the next role come from
+    the smallest polarity-specific neighbor list of an already assigned role,
+    so cost follows local edge density rather than diagram size. Only nodes
+    below `node_limit` are considered.
+    """
+    limit = graph.n if node_limit is None else node_limit
+    role_index = {role: i for i, role in enumerate(pattern.roles)}
+    constraints = [(role_index[a], role_index[b], sign) for a, b, sign in pattern.edges]
+    order = _search_order(len(pattern.roles), constraints)
+    step_of = {role: step for step, role in enumerate(order)}
+
+    # Constraints checked when each step's role is assigned (the other end is earlier)
+    links = [[] for _ in order]
+    for a, b, sign in constraints:
+        links[max(step_of[a], step_of[b])].append((a, b, sign))
+
+    first = order[0]
+    first_needs = [
+        (graph.successors, sign) if a == first else (graph.predecessors, sign)
+        for a, b, sign in constraints if first in (a, b)
+    ]
+    first_candidates = [
+        u for u in range(limit)
+        if all(len(neighbors(u, sign)) for neighbors, sign in first_needs)
+    ]
+
+    assignment = [None] * len(pattern.roles)
+    used = set()
+    seen = set()
+
+    def candidates(step, role):
+        best = None if links[step] else range(limit)
+        for a, b, sign in links[step]:
+            if a == role:
+                nodes = graph.predecessors(assignment[b], sign)
+            else:
+                nodes = graph.successors(assignment[a], sign)
+            if best is None or len(nodes) < len(best):
+                best = nodes
+        return best
+
+    def extend(step):
+        if step == len(order):
+            key = frozenset(assignment)
+            if key not in seen:
+                seen.add(key)
+                yield tuple(assignment)
+            return
+        role = order[step]
+        nodes = first_candidates if step == 0 else candidates(step, role)
+        for u in nodes:
+            if u >= limit or u in used:
+                continue
+            assignment[role] = u
+            if all(graph.sign(assignment[a], assignment[b]) == sign for a, b, sign in links[step]):
+                used.add(u)
+                yield from extend(step + 1)
+                used.discard(u)
+        assignment[role] = None
+
+    yield from extend(0)
+
+def _search_order(role_count, constraints):
+    """
+    Orders roles so that each one after the first is linked to an earlier
+    role, starting from the most constrained role.
+    """
+    degree = [0] * role_count
+    for a, b, _ in constraints:
+        degree[a] += 1
+        degree[b] += 1
+
+    order = [max(range(role_count), key=lambda role: degree[role])]
+    while len(order) < role_count:
+        placed = set(order)
+        links_to_placed = [0] * role_count
+        for a, b, _ in constraints:
+            if a in placed and b not in placed:
+                links_to_placed[b] += 1
+            elif b in placed and a not in placed:
+                links_to_placed[a] += 1
+        order.append(max(
+            (role for role in range(role_count) if role not in placed),
+            key=lambda role: (links_to_placed[role], degree[role])
+        ))
+    return order
@@ -1,655 +1,500 @@
-import networkx as nx
-from .entities import RelationshipType, LoopType, ArchetypeType, FeedbackLoop, Archetype
+import os
+import time
+import hashlib
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from .entities import LoopType, RelationshipType
+from .graph import CompactGraph, POSITIVE
+from .archetype_patterns import ARCHETYPE_PATTERNS, PATTERN_MOTIFS, match_pattern
+from ..metrics import (
+    ANALYSIS_GRAPH_BUILD_SECONDS, ANALYSIS_GRAPH_LOAD_SECONDS, ANALYSIS_LOOP_SEARCH_SECONDS,
+    ANALYSIS_CYCLES_ENUMERATED, ANALYSIS_CLASSIFICATION_SECONDS, ANALYSIS_ARCHETYPE_DETECTOR_SECONDS
+)
+
+# Size of the process pool used for per-component cycle enumeration
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", os.cpu_count() or 1))
+# Graphs with fewer edges are enumerated in-process; pickling would cost more than it saves
+PARALLEL_MIN_EDGES = int(os.getenv("ANALYSIS_PARALLEL_MIN_EDGES", 200))
+
+_process_pool = None
+
+def _get_process_pool():
+    """Returns the shared analysis process pool, creating it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS)
+    return _process_pool
+
+def _reset_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+    _process_pool = None
+
+class BoundedCycleSearch:
+    """
+    Lazily enumerates the simple cycles of a CompactGraph, stopping once any
+    of the configured limits is reached.
+        max_length  : longest cycle (in variables) that is considered
+        max_loops   : maximum number of cycles yielded
+        time_budget : wall-clock budget in seconds for the whole enumeration
+    After iteration, `truncated` tells whether a limit cut the search short.
+    """
+
+    def __init__(self, graph, max_length=None, max_loops=None, time_budget=None):
+        self.graph = graph
+        self.max_length = max_length
+        self.max_loops = max_loops
+        self.time_budget = time_budget
+        self.truncated = False
+
+    def __iter__(self):
+        deadline = None if self.time_budget is None else time.monotonic() + self.time_budget
+        yielded = 0
+
+        for cycle in self.graph.simple_cycles(length_bound=self.max_length, deadline=deadline):
+            if self.max_loops is not None and yielded >= self.max_loops:
+                self.truncated = True
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                self.truncated = True
+                return
+            yielded += 1
+            yield cycle
+
+        # simple_cycles also stops, silently, when the deadline passes between cycles
+        if deadline is not None and time.monotonic() > deadline:
+            self.truncated = True
+
+def _enumerate_component_cycles(component, max_length, max_loops, deadline):
+    """
+    Process pool task: enumerates the cycles of one strongly connected
+    component (a CompactGraph subgraph). Cycles are returned in the parent
+    graph's indices. `deadline` is an absolute time.time() value shared by
+    all components of the same analysis.
+    """
+    time_budget = None
+    if deadline is not None:
+        time_budget = deadline - time.time()
+        if time_budget <= 0:
+            return [], True
+
+    search = BoundedCycleSearch(component, max_length=max_length, max_loops=max_loops, time_budget=time_budget)
+    parent = component.node_ids
+    cycles = [[parent[u] for u in cycle] for cycle in search]
+    return cycles, search.truncated
+
+def _match_archetype_pattern(graph, pattern_index, node_limit, limit=None):
+    """
+    Process pool task: matches of one archetype pattern as node index tuples,
+    at most `limit` of them, whether more were available, and the seconds
+    spent (metrics recorded in a pool worker would be lost).
+    """
+    started = time.perf_counter()
+    matches = match_pattern(graph, ARCHETYPE_PATTERNS[pattern_index], node_limit=node_limit)
+    if limit is None:
+        found, truncated = list(matches), False
+    else:
+        found = list(islice(matches, limit + 1))
+        found, truncated = found[:limit], len(found) > limit
+    return found, truncated, time.perf_counter() - started
+
+class ComponentCycleSearch:
+    """
+    Enumerates the simple cycles of a CompactGraph one strongly connected
+    component at a time. Every cycle lies inside a single component, so
+    trivial components (a single variable) are skipped and the remaining ones
+    are searched independently: fanned out to the process pool when there are
+    several and the graph is large enough, streamed in-process otherwise.
+    Limits apply per component; `truncated` is set if any of them was hit.
+    At most ANALYSIS_WORKERS components are in the pool at a time, so a
+    consumer that stops early leaves no queued work behind.
+    """
+
+    def __init__(self, graph, max_length=None, max_loops=None, time_budget=None):
+        self.components = [
+            graph.subgraph(nodes) for nodes in graph.strongly_connected_components()
+            if len(nodes) > 1
+        ]
+        self.max_length = max_length
+        self.max_loops = max_loops
+        self.time_budget = time_budget
+        self.truncated = False
+
+    def __iter__(self):
+        deadline = None if self.time_budget is None else time.time() + self.time_budget
+        edge_count = sum(c.edge_count for c in self.components)
+
+        if len(self.components) > 1 and ANALYSIS_WORKERS > 1 and edge_count >= PARALLEL_MIN_EDGES:
+            try:
+                yield from self._search_in_pool(deadline)
+                return
+            except BrokenProcessPool:
+                # A worker died; drop the pool and fall back to in-process search
+                _reset_process_pool()
+
+        for component in self.components:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                self.truncated = True
+                return
+            search = BoundedCycleSearch(
+                component, max_length=self.max_length, max_loops=self.max_loops, time_budget=remaining
+            )
+            parent = component.node_ids
+            for cycle in search:
+                yield [parent[u] for u in cycle]
+            self.truncated = self.truncated or search.truncated
+
+    def _search_in_pool(self, deadline):
+        pool = _get_process_pool()
+        # Largest components are submitted first, the next one as each finishes
+        pending = sorted(self.components, key=lambda component: component.edge_count)
+        running = set()
+        try:
+            while pending or running:
+                while pending and len(running) < ANALYSIS_WORKERS:
+                    running.add(pool.submit(
+                        _enumerate_component_cycles, pending.pop(), self.max_length, self.max_loops, deadline
+                    ))
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    cycles, truncated = future.result()
+                    self.truncated = self.truncated or truncated
+                    yield from cycles
+        finally:
+            # Reached when the consumer stops early too; started tasks end at their own limits
+            for future in running:
+                future.cancel()
 
 class CLDAnalyzer:
     """Contains logic for analyzing Causal Loop Diagrams"""
-    
-    @staticmethod
-    def identify_feedback_loops(cld, session):
-        """Identifies feedback loops within the CLD using networkx."""
-        G = nx.DiGraph()
-        
-        # Add edges to the graph
-        for rel in cld.relationships:
-            G.add_edge(rel.source_id, rel.target_id, type=rel.type)
-
-        # Find all simple cycles in the graph
-        cycles = list(nx.simple_cycles(G))
-        unique_cycles = set()
-
-        for cycle in cycles:
-            # Convert cycle to a canonical form (sorted tuple)
-            canonical_cycle = tuple(sorted(cycle))
-            if canonical_cycle not in unique_cycles:
-                unique_cycles.add(canonical_cycle)
-                CLDAnalyzer._classify_cycle(cld, cycle, session)
-                
-        return cld.feedback_loops
 
     @staticmethod
-    def _classify_cycle(cld, cycle, session):
-        """Classifies a cycle as reinforcing or balancing."""
-        negative_count = 0
-
-        for i in range(len(cycle)):
-            source = cycle[i]
-            target = cycle[(i + 1) % len(cycle)]
-            for rel in cld.relationships:
-                if rel.source_id == source and rel.target_id == target:
-                    if rel.type == RelationshipType.NEGATIVE:
-                        negative_count += 1
-
-        loop_type = LoopType.REINFORCING if negative_count % 2 == 0 else LoopType.BALANCING
-
-        feedback_loop = FeedbackLoop(type=loop_type, cld=cld)
-        session.add(feedback_loop)
-        
-        # Verify all cycle variables are present
-        cycle_variables = []
-        for node in cycle:
-            variable = next((var for var in cld.variables if var.id == node), None)
-            if variable is None:
-                raise ValueError(f"Variable with id {node} not found in CLD variables.")
-            cycle_variables.append(variable)
-        
-        feedback_loop.variables = cycle_variables
-        cld.feedback_loops.append(feedback_loop)
-        
-        return feedback_loop
-
-    @staticmethod
-    def identify_archetypes(cld, session):
-        """Identifies system archetypes within the CLD."""
-        CLDAnalyzer._identify_shifting_the_burden(cld, session)
-        CLDAnalyzer._identify_fixes_that_fail(cld, session)
-        CLDAnalyzer._identify_limits_to_success(cld, session)
-        CLDAnalyzer._identify_drifting_goals(cld, session)
-        CLDAnalyzer._identify_growth_and_underinvestment(cld, session)
-        CLDAnalyzer._identify_success_to_the_successful(cld, session)
-        CLDAnalyzer._identify_escalation(cld, session)
-        CLDAnalyzer._identify_tragedy_of_the_commons(cld, session)
-        return cld.archetypes
-
+    def build_graph(cld):
+        """
+        Compact integer-indexed snapshot of the CLD shared by loop and
+        archetype analysis. Node i < len(cld.variables) is cld.variables[i].
+        """
+        with ANALYSIS_GRAPH_BUILD_SECONDS.time():
+            return CompactGraph.from_cld(cld)
+    
     @staticmethod
-    def _identify_shifting_the_burden(cld, session):
+    def load_graph(snapshot):
         """
-        Identify the 'Shifting the Burden' archetype.
-        Canonical pattern:
-            Problem Symptom (PS) <-> Symptomatic Solution (SS) : PS->SS (+), SS->PS (−)
-            Problem Symptom (PS) <-> Fundamental Solution (FS) : PS->FS (+), FS->PS (−)
-            Side-effect (SE): SS->SE (+), SE->FS (−)
-        This implementation searches for the qualitative wiring consistent with the pattern.
+        Graph of a CLD from its stored snapshot, without loading any
+        variables or relationships. Returns (graph, variable_count).
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-
-        for var_ps in cld.variables:
-            var_ss_candidates = [
-                var for var in cld.variables 
-                if rel_map.get((var.id, var_ps.id)) == RelationshipType.NEGATIVE 
-                and rel_map.get((var_ps.id, var.id)) == RelationshipType.POSITIVE
-            ]
-            var_fs_candidates = [
-                var for var in cld.variables 
-                if rel_map.get((var.id, var_ps.id)) == RelationshipType.NEGATIVE 
-                and rel_map.get((var_ps.id, var.id)) == RelationshipType.POSITIVE
-            ]
-
-            for var_ss in var_ss_candidates:
-                for var_fs in var_fs_candidates:
-                    var_se_candidates = [
-                        var for var in cld.variables 
-                        if rel_map.get((var_ss.id, var.id)) == RelationshipType.POSITIVE 
-                        and rel_map.get((var.id, var_fs.id)) == RelationshipType.NEGATIVE
-                    ]
-
-                    for var_se in var_se_candidates:
-                        archetype = Archetype(type=ArchetypeType.SHIFTING_THE_BURDEN, cld=cld)
-                        archetype.variables.extend([var_ps, var_ss, var_fs, var_se])
-                        session.add(archetype)
-                        cld.archetypes.append(archetype)
-                        
-        return cld.archetypes
+        with ANALYSIS_GRAPH_LOAD_SECONDS.time():
+            return CompactGraph.from_snapshot(snapshot)
     
     @staticmethod
-    def _identify_fixes_that_fail(cld, session):
+    def fingerprint(cld, analysis, **params):
         """
-        Identify the 'Fixes that Fail' archetype.
-        Canonical pattern (no explicit delay modeled here):
-            Problem Symptom (PS) -> Fix / Quick Solution (F) : (+)
-            Fix (F) -> Problem Symptom (PS) : (−)         [short balancing loop]
-            Fix (F) -> Unintended Consequence (UC) : (+)
-            Unintended Consequence (UC) -> Problem Symptom (PS) : (+)  [reinforcing drift back]
+        Canonical SHA-256 of the CLD's variable set and signed relationship
+        set, together with the analysis name and its parameters. Two CLDs
+        with the same variables wired the same way share a fingerprint, so
+        their results are interchangeable.
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-        created = set()  # avoid duplicates for the same trio
-
-        for var_ps in cld.variables:
-            # Step 1: candidates for F (quick fix) forming the short balancing loop with PS
-            f_candidates = [
-                v for v in cld.variables
-                if v.id != var_ps.id
-                and rel_map.get((var_ps.id, v.id)) == RelationshipType.POSITIVE
-                and rel_map.get((v.id, var_ps.id)) == RelationshipType.NEGATIVE
-            ]
-
-            for var_f in f_candidates:
-                # Step 2: candidates for UC (unintended consequence)
-                uc_candidates = [
-                    v for v in cld.variables
-                    if v.id not in {var_ps.id, var_f.id}
-                    and rel_map.get((var_f.id, v.id)) == RelationshipType.POSITIVE
-                    and rel_map.get((v.id, var_ps.id)) == RelationshipType.POSITIVE
-                ]
-
-                for var_uc in uc_candidates:
-                    key = tuple(sorted([var_ps.id, var_f.id, var_uc.id]))
-                    if key in created:
-                        continue
-
-                    archetype = Archetype(type=ArchetypeType.FIXES_THAT_FAIL, cld=cld)
-                    session.add(archetype)
-                    cld.archetypes.append(archetype)
-                    archetype.variables.extend([var_ps, var_f, var_uc])
-                    created.add(key)
-        
-        return cld.archetypes
+        return CLDAnalyzer.diagram_fingerprint(
+            [var.id for var in cld.variables],
+            ((rel.source_id, rel.target_id, rel.type) for rel in cld.relationships),
+            analysis,
+            **params
+        )
+
+    @staticmethod
+    def graph_fingerprint(graph, variable_count, analysis, **params):
+        """fingerprint of a CLD graph; equal to fingerprint() of the CLD it was built from."""
+        node_ids = graph.node_ids
+        return CLDAnalyzer.diagram_fingerprint(
+            node_ids[:variable_count],
+            (
+                (node_ids[u], node_ids[v], RelationshipType.POSITIVE if sign == POSITIVE else RelationshipType.NEGATIVE)
+                for u, v, sign in graph.edges()
+            ),
+            analysis,
+            **params
+        )
+
+    @staticmethod
+    def diagram_fingerprint(variable_ids, triples, analysis, **params):
+        """fingerprint of variable ids and (source_id, target_id, RelationshipType) triples."""
+        digest = hashlib.sha256()
+        digest.update(analysis.encode())
+        for name in sorted(params):
+            digest.update(f"|{name}={params[name]!r}".encode())
+        for var_id in sorted(variable_ids):
+            digest.update(f"|v:{var_id}".encode())
+        # Repeated relationships count once, as in the graph
+        for source_id, target_id, rel_type in sorted(
+            {(source_id, target_id, rel_type.name) for source_id, target_id, rel_type in triples}
+        ):
+            digest.update(f"|r:{source_id}>{target_id}:{rel_type}".encode())
+        return digest.hexdigest()
 
     @staticmethod
-    def _identify_limits_to_success(cld, session):
+    def identify_feedback_loops(cld, max_length=None, max_loops=None, time_budget=None, graph=None):
         """
-        Identify the 'Limits to Success' archetype (simplified, no explicit delays).
-        Canonical pattern:
-            Efforts (E) -> Performance (P) : (+)
-            Performance (P) -> Efforts (E) : (+)         [reinforcing loop R1]
-            Performance (P) -> Limiting Action (LA) : (+)
-            Limiting Action (LA) -> Performance (P) : (−) [balancing loop B2]
-            Constraint (C) -> Limiting Action (LA) : (+)
+        Identifies feedback loops within the CLD.
+        The graph is decomposed into strongly connected components which are
+        searched independently; results are merged through _classify_cycle.
+        Nothing is persisted: returns a list of (LoopType, variable ids)
+        tuples and whether the search was stopped early by one of the limits.
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-        created = set()
-
-        for var_p in cld.variables:
-            # Step 1: candidates for E (efforts) forming a 2-link reinforcing loop with P
-            e_candidates = [
-                v for v in cld.variables
-                if v.id != var_p.id
-                and rel_map.get((v.id, var_p.id)) == RelationshipType.POSITIVE   # E -> P (+)
-                and rel_map.get((var_p.id, v.id)) == RelationshipType.POSITIVE   # P -> E (+)
-            ]
-
-            # Step 2: candidates for LA (limiting action) tied to performance
-            la_candidates = [
-                v for v in cld.variables
-                if v.id != var_p.id
-                and rel_map.get((var_p.id, v.id)) == RelationshipType.POSITIVE   # P -> LA (+)
-                and rel_map.get((v.id, var_p.id)) == RelationshipType.NEGATIVE   # LA -> P (−)
-            ]
-
-            if not e_candidates or not la_candidates:
-                continue
-
-            for var_la in la_candidates:
-                # Step 3: candidates for C (constraint) driving LA
-                c_candidates = [
-                    v for v in cld.variables
-                    if v.id not in {var_p.id, var_la.id}
-                    and rel_map.get((v.id, var_la.id)) == RelationshipType.POSITIVE  # C -> LA (+)
-                ]
+        if graph is None:
+            graph = CLDAnalyzer.build_graph(cld)
+        return CLDAnalyzer.find_feedback_loops(
+            graph,
+            variable_count=len(cld.variables),
+            max_length=max_length,
+            max_loops=max_loops,
+            time_budget=time_budget
+        )
 
-                for var_e in e_candidates:
-                    for var_c in c_candidates:
-                        key = tuple(sorted([var_e.id, var_p.id, var_la.id, var_c.id]))
-                        if key in created:
-                            continue
+    @staticmethod
+    def find_feedback_loops(graph, variable_count=None, max_length=None, max_loops=None, time_budget=None):
+        """
+        ORM-free core of identify_feedback_loops on a CompactGraph whose
+        first `variable_count` nodes (default: all) are variables.
+        """
+        if variable_count is None:
+            variable_count = graph.n
 
-                        archetype = Archetype(type=ArchetypeType.LIMITS_TO_SUCCESS, cld=cld)
-                        session.add(archetype)
-                        cld.archetypes.append(archetype)
-                        archetype.variables.extend([var_e, var_p, var_la, var_c])
-                        created.add(key)
+        started = time.perf_counter()
+        classification_seconds = 0.0
+        search = ComponentCycleSearch(graph, max_length=max_length, max_loops=max_loops, time_budget=time_budget)
+        unique_cycles = set()
+        feedback_loops = []
+        truncated = False
 
-        return cld.archetypes
+        for cycle in search:
+            # Convert cycle to a canonical form (sorted tuple)
+            canonical_cycle = tuple(sorted(cycle))
+            if canonical_cycle in unique_cycles:
+                continue
+            if max_loops is not None and len(unique_cycles) >= max_loops:
+                truncated = True
+                break
+            unique_cycles.add(canonical_cycle)
+            classify_started = time.perf_counter()
+            feedback_loops.append(CLDAnalyzer._classify_cycle(graph, cycle, variable_count))
+            classification_seconds += time.perf_counter() - classify_started
+        
+        ANALYSIS_LOOP_SEARCH_SECONDS.observe(time.perf_counter() - started)
+        ANALYSIS_CLASSIFICATION_SECONDS.observe(classification_seconds)
+        ANALYSIS_CYCLES_ENUMERATED.observe(len(feedback_loops))
+        return feedback_loops, truncated or search.truncated
 
     @staticmethod
-    def _identify_drifting_goals(cld, session):
+    def _classify_cycle(graph, cycle, variable_count):
         """
-        Identify the 'Drifting Goals' (Eroding Goals) archetype.
-        Wiring (Gap central to both loops):
-        - G -> Gap (+), A -> Gap (-)
-        - [B1] A (-) -> Gap (+) -> CA (+) -> A
-        - [B2] G (+) -> Gap (+) -> PLG (-) -> G
+        Classifies a cycle (graph node indices) as reinforcing or balancing.
+        Returns (LoopType, variable ids in cycle order).
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-        created = set()
-
-        for var_g in cld.variables:
-            # Step 1a: choose a Gap variable influenced by Goal (+)
-            gap_candidates = [
-                v for v in cld.variables
-                if v.id != var_g.id and rel_map.get((var_g.id, v.id)) == RelationshipType.POSITIVE
-            ]
-            for var_gap in gap_candidates:
-                # Step 1b: find Actual with A -> Gap (-)
-                a_candidates = [
-                    v for v in cld.variables
-                    if v.id not in {var_g.id, var_gap.id}
-                    and rel_map.get((v.id, var_gap.id)) == RelationshipType.NEGATIVE
-                ]
-                if not a_candidates:
-                    continue
+        loop_type = LoopType.REINFORCING if graph.cycle_sign(cycle) == POSITIVE else LoopType.BALANCING
 
-                # Step 3: PLG for this (G, Gap)
-                plg_candidates = [
-                    v for v in cld.variables
-                    if v.id not in {var_g.id, var_gap.id}
-                    and rel_map.get((var_gap.id, v.id)) == RelationshipType.POSITIVE   # Gap -> PLG (+)
-                    and rel_map.get((v.id, var_g.id)) == RelationshipType.NEGATIVE     # PLG -> Goal (-)
-                ]
-                if not plg_candidates:
-                    continue
+        # Verify all cycle variables are present
+        for node in cycle:
+            if node >= variable_count:
+                raise ValueError(f"Variable with id {graph.node_ids[node]} not found in CLD variables.")
 
-                for var_a in a_candidates:
-                    # Step 2: CA for this (Gap, A)
-                    ca_candidates = [
-                        v for v in cld.variables
-                        if v.id not in {var_g.id, var_gap.id, var_a.id}
-                        and rel_map.get((var_gap.id, v.id)) == RelationshipType.POSITIVE  # Gap -> CA (+)
-                        and rel_map.get((v.id, var_a.id)) == RelationshipType.POSITIVE    # CA -> A (+)
-                    ]
-                    if not ca_candidates:
-                        continue
-
-                    for var_ca in ca_candidates:
-                        for var_plg in plg_candidates:
-                            key = tuple(sorted([var_g.id, var_a.id, var_gap.id, var_ca.id, var_plg.id]))
-                            if key in created:
-                                continue
-
-                            archetype = Archetype(type=ArchetypeType.DRIFTING_GOALS, cld=cld)
-                            session.add(archetype)
-                            cld.archetypes.append(archetype)
-                            archetype.variables.extend([var_g, var_a, var_gap, var_ca, var_plg])
-                            created.add(key)
-
-        return cld.archetypes
+        return loop_type, [graph.node_ids[node] for node in cycle]
 
     @staticmethod
-    def _identify_growth_and_underinvestment(cld, session):
+    def update_feedback_loops(cld, previous_edges, stored_loops, max_length=None, graph=None, time_budget=None):
         """
-        Identify the 'Growth and Underinvestment' archetype.
-
-        Canonical pattern (no explicit delays modeled here):
-            Reinforcing growth (R1):
-                Growth Effort (E) -> Demand (D) : (+)
-                Demand (D) -> Growth Effort (E) : (+)
-
-            Service shortfall / limiting path (B2):
-                Demand (D) -> Impact of Limiting Factor (ILF) : (+)
-                Impact of Limiting Factor (ILF) -> Demand (D) : (−)
-
-            Investment/capacity build-up (B3):
-                ILF -> Perceived Need to Invest (PNI) : (+)
-                Performance Standard (PS) -> PNI : (+)
-                PNI -> Investment in Capacity (IC) : (+)
-                IC -> Capacity (C) : (+)
-                Capacity (C) -> Impact of Limiting Factor (ILF) : (−)
+        Incrementally maintains the stored loops after the CLD was edited.
+            previous_edges : (source_id, target_id) pairs present before the edit
+            stored_loops   : [(loop id, LoopType, variable ids in cycle order)]
+            max_length     : bound of the analysis that stored the loops
+        Loops that lost an edge or a variable are dropped, loops whose edge
+        polarity changed are re-classified, and for each added edge u -> v only
+        the new cycles through it (the simple paths v ~> u) are enumerated.
+        The per-variable-set deduplication of identify_feedback_loops holds.
+        Returns (deleted loop ids, [(loop id, new LoopType)], [(LoopType,
+        variable ids)], truncated); when `time_budget` (seconds) runs out the
+        changes are incomplete and truncated is True.
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-        created = set()
-
-        # Step 1: choose Demand (D) and find Growth Effort (E) forming R1
-        for var_d in cld.variables:
-            e_candidates = [
-                v for v in cld.variables
-                if v.id != var_d.id
-                and rel_map.get((v.id, var_d.id)) == RelationshipType.POSITIVE   # E -> D (+)
-                and rel_map.get((var_d.id, v.id)) == RelationshipType.POSITIVE   # D -> E (+)
-            ]
-            if not e_candidates:
+        if graph is None:
+            graph = CLDAnalyzer.build_graph(cld)
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        index = graph.index
+        variable_count = len(cld.variables)
+
+        deleted = []
+        retyped = []
+        broken_cycles = []
+        known_cycles = set()
+        for loop_id, loop_type, variable_ids in stored_loops:
+            cycle = [index.get(var_id) for var_id in variable_ids]
+            if any(node is None or node >= variable_count for node in cycle):
+                deleted.append(loop_id)
                 continue
-
-            # Step 2: ILF tied to Demand both ways B2
-            ilf_candidates = [
-                v for v in cld.variables
-                if v.id != var_d.id
-                and rel_map.get((var_d.id, v.id)) == RelationshipType.POSITIVE   # D -> ILF (+)
-                and rel_map.get((v.id, var_d.id)) == RelationshipType.NEGATIVE   # ILF -> D (−)
-            ]
-            if not ilf_candidates:
+            if any(graph.sign(node, cycle[(i + 1) % len(cycle)]) is None for i, node in enumerate(cycle)):
+                deleted.append(loop_id)
+                broken_cycles.append(cycle)
                 continue
-
-            # Step 3: capacity chain ending at ILF B3
-            c_candidates = [
-                v for v in cld.variables
-                if v.id != var_d.id
-            ]
-
-            for var_ilf in ilf_candidates:
-                # C -> ILF (−)
-                c_to_ilf = [
-                    v for v in c_candidates
-                    if rel_map.get((v.id, var_ilf.id)) == RelationshipType.NEGATIVE
-                ]
-                if not c_to_ilf:
+            new_type, _ = CLDAnalyzer._classify_cycle(graph, cycle, variable_count)
+            if new_type != loop_type:
+                retyped.append((loop_id, new_type))
+            known_cycles.add(tuple(sorted(cycle)))
+
+        # Loops are deduplicated by variable set, so another ordering of a
+        # broken loop's variables may still close a cycle without new edges
+        new_loops = []
+        for cycle in broken_cycles:
+            canonical_cycle = tuple(sorted(cycle))
+            if canonical_cycle in known_cycles:
+                continue
+            component = graph.subgraph(cycle)
+            for candidate in component.simple_cycles(length_bound=len(cycle), deadline=deadline):
+                if len(candidate) == len(cycle):
+                    known_cycles.add(canonical_cycle)
+                    new_loops.append(CLDAnalyzer._classify_cycle(
+                        graph, [component.node_ids[node] for node in candidate], variable_count
+                    ))
+                    break
+
+        # Edges are added one at a time; edges still pending are excluded so a
+        # new cycle is only found through the last of its added edges.
+        added_edges = [
+            (u, v) for u, v, _ in graph.edges()
+            if (graph.node_ids[u], graph.node_ids[v]) not in previous_edges
+        ]
+        pending = {graph.edge_key(u, v) for u, v in added_edges}
+        for u, v in added_edges:
+            pending.discard(graph.edge_key(u, v))
+            paths = graph.simple_paths(v, u, length_bound=max_length, excluded_edges=pending, deadline=deadline)
+            for path in paths:
+                canonical_cycle = tuple(sorted(path))
+                if canonical_cycle in known_cycles:
                     continue
+                known_cycles.add(canonical_cycle)
+                new_loops.append(CLDAnalyzer._classify_cycle(graph, path, variable_count))
+            if deadline is not None and time.monotonic() > deadline:
+                return deleted, retyped, new_loops, True
 
-                for var_c in c_to_ilf:
-                    # IC -> C (+)
-                    ic_candidates = [
-                        v for v in cld.variables
-                        if v.id not in {var_d.id, var_ilf.id, var_c.id}
-                        and rel_map.get((v.id, var_c.id)) == RelationshipType.POSITIVE
-                    ]
-                    if not ic_candidates:
-                        continue
-
-                    for var_ic in ic_candidates:
-                        # PNI -> IC (+)
-                        pni_candidates = [
-                            v for v in cld.variables
-                            if v.id not in {var_d.id, var_ilf.id, var_c.id, var_ic.id}
-                            and rel_map.get((v.id, var_ic.id)) == RelationshipType.POSITIVE
-                        ]
-                        if not pni_candidates:
-                            continue
-
-                        for var_pni in pni_candidates:
-                            # Step 4: PNI parents: ILF -> PNI (+), PS -> PNI (+)
-                            if rel_map.get((var_ilf.id, var_pni.id)) != RelationshipType.POSITIVE:
-                                continue
-                            ps_candidates = [
-                                v for v in cld.variables
-                                if v.id not in {var_d.id, var_ilf.id, var_c.id, var_ic.id, var_pni.id}
-                                and rel_map.get((v.id, var_pni.id)) == RelationshipType.POSITIVE
-                            ]
-                            if not ps_candidates:
-                                continue
-
-                            for var_e in e_candidates:
-                                for var_ps in ps_candidates:
-                                    key = tuple(sorted([
-                                        var_e.id, var_d.id, var_ilf.id, var_pni.id, var_ic.id, var_c.id, var_ps.id
-                                    ]))
-                                    if key in created:
-                                        continue
-
-                                    archetype = Archetype(type=ArchetypeType.GROWTH_AND_UNDERINVESTMENT, cld=cld)
-                                    session.add(archetype)
-                                    cld.archetypes.append(archetype)
-                                    archetype.variables.extend([var_e, var_d, var_ilf, var_pni, var_ic, var_c, var_ps])
-                                    created.add(key)
-        return cld.archetypes
+        # The searches above stop silently at the deadline
+        return deleted, retyped, new_loops, deadline is not None and time.monotonic() > deadline
 
     @staticmethod
-    def _identify_success_to_the_successful(cld, session):
+    def loop_census(cld, max_length, time_budget=None, graph=None):
         """
-        Identify the 'Success to the Successful' archetype.
-
-        Canonical pattern (two competing reinforcing loops sharing an allocation variable A):
-            Branch A (R1):
-                Success_A (SA)  -> Allocation_to_A_instead_of_B (A) : (+)
-                A               -> Resources_to_A (RA)              : (+)
-                RA              -> SA                               : (+)
-
-            Branch B (R2):
-                Success_B (SB)  -> A                                : (−)
-                A               -> Resources_to_B (RB)              : (−)
-                RB              -> SB                               : (+)
+        Counts the feedback loops of the CLD by length and LoopType without
+        storing them. Loops are the ones find_feedback_loops returns: one per
+        variable set, typed by the first ordering found, so the counts match
+        the stored loops of the same max_length. Only the variable sets seen
+        are kept. Returns ({length: {LoopType: count}}, truncated).
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-        created = set()
-
-        for alloc in cld.variables:
-            # Step 1 (Branch A): alloc -> RA (+), RA -> SA (+), SA -> alloc (+)
-            ra_candidates = [
-                v for v in cld.variables
-                if v.id != alloc.id and rel_map.get((alloc.id, v.id)) == RelationshipType.POSITIVE
-            ]
-            branch_a = []
-            for ra in ra_candidates:
-                sa_list = [
-                    v for v in cld.variables
-                    if v.id not in {alloc.id, ra.id}
-                    and rel_map.get((ra.id, v.id)) == RelationshipType.POSITIVE
-                    and rel_map.get((v.id, alloc.id)) == RelationshipType.POSITIVE
-                ]
-                for sa in sa_list:
-                    branch_a.append((ra, sa))
-            if not branch_a:
-                continue
+        if graph is None:
+            graph = CLDAnalyzer.build_graph(cld)
 
-            # Step 2 (Branch B): alloc -> RB (−), RB -> SB (+), SB -> alloc (−)
-            rb_candidates = [
-                v for v in cld.variables
-                if v.id != alloc.id and rel_map.get((alloc.id, v.id)) == RelationshipType.NEGATIVE
-            ]
-            branch_b = []
-            for rb in rb_candidates:
-                sb_list = [
-                    v for v in cld.variables
-                    if v.id not in {alloc.id, rb.id}
-                    and rel_map.get((rb.id, v.id)) == RelationshipType.POSITIVE
-                    and rel_map.get((v.id, alloc.id)) == RelationshipType.NEGATIVE
-                ]
-                for sb in sb_list:
-                    branch_b.append((rb, sb))
-            if not branch_b:
+        census = {}
+        unique_cycles = set()
+        search = ComponentCycleSearch(graph, max_length=max_length, time_budget=time_budget)
+        for cycle in search:
+            canonical_cycle = tuple(sorted(cycle))
+            if canonical_cycle in unique_cycles:
                 continue
+            unique_cycles.add(canonical_cycle)
+            loop_type = LoopType.REINFORCING if graph.cycle_sign(cycle) == POSITIVE else LoopType.BALANCING
+            by_type = census.setdefault(len(cycle), {LoopType.REINFORCING: 0, LoopType.BALANCING: 0})
+            by_type[loop_type] += 1
+
+        return census, search.truncated
 
-            # Step 3: combine branches ensuring distinct nodes
-            for (ra, sa) in branch_a:
-                for (rb, sb) in branch_b:
-                    ids = {alloc.id, ra.id, sa.id, rb.id, sb.id}
-                    if len(ids) < 5:
-                        continue
-
-                    key = tuple(sorted(ids))
-                    if key in created:
-                        continue
-
-                    archetype = Archetype(type=ArchetypeType.SUCCESS_TO_THE_SUCCESSFUL, cld=cld)
-                    session.add(archetype)
-                    cld.archetypes.append(archetype)
-                    archetype.variables.extend([alloc, ra, sa, rb, sb])
-                    created.add(key)
-                
-        return cld.archetypes
-    
     @staticmethod
-    def _identify_escalation(cld, session):
+    def motif_census(cld, graph=None):
         """
-        Identify the 'Escalation' archetype.
-
-        Canonical pattern (no delays modeled):
-            Center variable Q = "Quality of A's Position Relative to B's"
-
-            Loop B1 (A-side):
-                Threat_A (TA) -> Activity_A (ActA) : (+)
-                Activity_A (ActA) -> Result_A (ResA) : (+)
-                Result_A (ResA) -> Q : (+)
-                Q -> Threat_A (TA) : (−)
-
-            Loop B2 (B-side):
-                Threat_B (TB) -> Activity_B (ActB) : (+)
-                Activity_B (ActB) -> Result_B (ResB) : (+)
-                Result_B (ResB) -> Q : (−)
-                Q -> Threat_B (TB) : (+)
+        Signed 2- and 3-node motif counts of the CLD, and the archetypes whose
+        required motifs are all present (the only ones that can match).
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-        created = set()
-
-        for var_q in cld.variables:
-            # Step 1: A-side (B1)
-            ta_candidates = [
-                v for v in cld.variables
-                if v.id != var_q.id and rel_map.get((var_q.id, v.id)) == RelationshipType.NEGATIVE  # Q -> TA (−)
-            ]
-            a_side = []
-            for var_ta in ta_candidates:
-                acta_list = [
-                    v for v in cld.variables
-                    if v.id not in {var_q.id, var_ta.id}
-                    and rel_map.get((var_ta.id, v.id)) == RelationshipType.POSITIVE  # TA -> ActA (+)
-                ]
-                for var_acta in acta_list:
-                    resa_list = [
-                        v for v in cld.variables
-                        if v.id not in {var_q.id, var_ta.id, var_acta.id}
-                        and rel_map.get((var_acta.id, v.id)) == RelationshipType.POSITIVE  # ActA -> ResA (+)
-                        and rel_map.get((v.id, var_q.id)) == RelationshipType.POSITIVE    # ResA -> Q (+)
-                    ]
-                    for var_resa in resa_list:
-                        a_side.append((var_ta, var_acta, var_resa))
-            if not a_side:
-                continue
+        if graph is None:
+            graph = CLDAnalyzer.build_graph(cld)
 
-            # Step 2: B-side (B2)
-            tb_candidates = [
-                v for v in cld.variables
-                if v.id != var_q.id and rel_map.get((var_q.id, v.id)) == RelationshipType.POSITIVE  # Q -> TB (+)
-            ]
-            b_side = []
-            for var_tb in tb_candidates:
-                actb_list = [
-                    v for v in cld.variables
-                    if v.id not in {var_q.id, var_tb.id}
-                    and rel_map.get((var_tb.id, v.id)) == RelationshipType.POSITIVE  # TB -> ActB (+)
-                ]
-                for var_actb in actb_list:
-                    resb_list = [
-                        v for v in cld.variables
-                        if v.id not in {var_q.id, var_tb.id, var_actb.id}
-                        and rel_map.get((var_actb.id, v.id)) == RelationshipType.POSITIVE  # ActB -> ResB (+)
-                        and rel_map.get((v.id, var_q.id)) == RelationshipType.NEGATIVE     # ResB -> Q (−)
-                    ]
-                    for var_resb in resb_list:
-                        b_side.append((var_tb, var_actb, var_resb))
-            if not b_side:
-                continue
+        census = graph.motif_census()
+        candidates = [
+            pattern.archetype_type for pattern in ARCHETYPE_PATTERNS
+            if pattern.could_match(census)
+        ]
+        return census, candidates
 
-            # Step 3: combine sides ensuring distinct nodes
-            for (var_ta, var_acta, var_resa) in a_side:
-                for (var_tb, var_actb, var_resb) in b_side:
-                    ids = {var_q.id, var_ta.id, var_acta.id, var_resa.id, var_tb.id, var_actb.id, var_resb.id}
-                    if len(ids) < 7:
-                        continue
-
-                    key = tuple(sorted(ids))
-                    if key in created:
-                        continue
-
-                    archetype = Archetype(type=ArchetypeType.ESCALATION, cld=cld)
-                    session.add(archetype)
-                    cld.archetypes.append(archetype)
-                    archetype.variables.extend([var_q, var_ta, var_acta, var_resa, var_tb, var_actb, var_resb])
-                    created.add(key)
-        
-        return cld.archetypes
-    
     @staticmethod
-    def _identify_tragedy_of_the_commons(cld, session):
+    def identify_archetypes(cld, graph=None, max_per_type=None, max_total=None):
         """
-        Identify the 'Tragedy of the Commons' archetype.
-
-        Canonical pattern (no explicit delays modeled here):
-            Two actors (A and B) draw from a shared commons.
-
-            R1 (A-side reinforcement):
-                A_Activity -> NetGains_A : (+)
-                NetGains_A -> A_Activity : (+)
-
-            R2 (B-side reinforcement):
-                B_Activity -> NetGains_B : (+)
-                NetGains_B -> B_Activity : (+)
-
-            Shared commons coupling:
-                A_Activity -> TotalActivity : (+)
-                B_Activity -> TotalActivity : (+)
-                TotalActivity -> GainPerIndividual : (−)
-                GainPerIndividual -> A_Activity : (−)
-                GainPerIndividual -> B_Activity : (−)
-
-            Additional balancing links (as in the diagram):
-                GainPerIndividual -> NetGains_A : (+)
-                GainPerIndividual -> NetGains_B : (+)
-                ResourceLimit -> GainPerIndividual : (+)
+        Identifies system archetypes within the CLD by matching each
+        declarative pattern in ARCHETYPE_PATTERNS against the graph. Patterns
+        whose signed motifs are missing from the graph are skipped.
+        At most `max_per_type` matches are kept per archetype and `max_total`
+        overall. Nothing is persisted: returns a list of
+        (ArchetypeType, variable ids) and whether a limit dropped matches.
         """
-        rel_map = {(rel.source_id, rel.target_id): rel.type for rel in cld.relationships}
-        created = set()
-
-        # Step 1: choose Total and GainPer with the negative link Total -> GainPer
-        for var_total in cld.variables:
-            gain_candidates = [
-                v for v in cld.variables
-                if v.id != var_total.id and rel_map.get((var_total.id, v.id)) == RelationshipType.NEGATIVE
-            ]
-            for var_gain in gain_candidates:
-                # Resource limit must boost gain per individual
-                rl_candidates = [
-                    v for v in cld.variables
-                    if v.id not in {var_total.id, var_gain.id}
-                    and rel_map.get((v.id, var_gain.id)) == RelationshipType.POSITIVE
-                ]
-                if not rl_candidates:
-                    continue
-
-                # Step 2: A branch
-                a_act_candidates = [
-                    v for v in cld.variables
-                    if v.id not in {var_total.id, var_gain.id}
-                    and rel_map.get((var_gain.id, v.id)) == RelationshipType.NEGATIVE  # Gain -> A (−)
-                    and rel_map.get((v.id, var_total.id)) == RelationshipType.POSITIVE  # A -> Total (+)
-                ]
-                a_branch = []
-                for var_a_act in a_act_candidates:
-                    a_ng_list = [
-                        v for v in cld.variables
-                        if v.id not in {var_total.id, var_gain.id, var_a_act.id}
-                        and rel_map.get((var_a_act.id, v.id)) == RelationshipType.POSITIVE   # A -> NG_A (+)
-                        and rel_map.get((v.id, var_a_act.id)) == RelationshipType.POSITIVE   # NG_A -> A (+)
-                        and rel_map.get((var_gain.id, v.id)) == RelationshipType.POSITIVE    # Gain -> NG_A (+)
-                    ]
-                    for var_a_ng in a_ng_list:
-                        a_branch.append((var_a_act, var_a_ng))
-                if not a_branch:
-                    continue
+        if graph is None:
+            graph = CLDAnalyzer.build_graph(cld)
+        return CLDAnalyzer.find_archetypes(
+            graph,
+            variable_count=len(cld.variables),
+            max_per_type=max_per_type,
+            max_total=max_total
+        )
 
-                # Step 3: B branch
-                b_act_candidates = [
-                    v for v in cld.variables
-                    if v.id not in {var_total.id, var_gain.id}
-                    and rel_map.get((var_gain.id, v.id)) == RelationshipType.NEGATIVE  # Gain -> B (−)
-                    and rel_map.get((v.id, var_total.id)) == RelationshipType.POSITIVE  # B -> Total (+)
-                ]
-                b_branch = []
-                for var_b_act in b_act_candidates:
-                    b_ng_list = [
-                        v for v in cld.variables
-                        if v.id not in {var_total.id, var_gain.id, var_b_act.id}
-                        and rel_map.get((var_b_act.id, v.id)) == RelationshipType.POSITIVE   # B -> NG_B (+)
-                        and rel_map.get((v.id, var_b_act.id)) == RelationshipType.POSITIVE   # NG_B -> B (+)
-                        and rel_map.get((var_gain.id, v.id)) == RelationshipType.POSITIVE    # Gain -> NG_B (+)
-                    ]
-                    for var_b_ng in b_ng_list:
-                        b_branch.append((var_b_act, var_b_ng))
-                if not b_branch:
-                    continue
+    @staticmethod
+    def find_archetypes(graph, variable_count=None, max_per_type=None, max_total=None):
+        """
+        ORM-free core of identify_archetypes on a CompactGraph whose first
+        `variable_count` nodes (default: all) are variables.
+        """
+        matches, truncated = CLDAnalyzer.detect_archetypes(
+            graph, node_limit=variable_count, max_per_type=max_per_type, max_total=max_total
+        )
+        archetypes = [
+            (archetype_type, [graph.node_ids[node] for node in members])
+            for archetype_type, members in matches
+        ]
+        return archetypes, truncated
 
-                # Step 4: combine branches and resource limit
-                for (var_a_act, var_a_ng) in a_branch:
-                    for (var_b_act, var_b_ng) in b_branch:
-                        for var_rl in rl_candidates:
-                            ids = {var_total.id, var_gain.id, var_rl.id, var_a_act.id, var_a_ng.id, var_b_act.id, var_b_ng.id}
-                            if len(ids) < 7:
-                                continue
-                            key = tuple(sorted(ids))
-                            if key in created:
-                                continue
-
-                            archetype = Archetype(type=ArchetypeType.TRAGEDY_OF_THE_COMMONS, cld=cld)
-                            session.add(archetype)
-                            cld.archetypes.append(archetype)
-                            archetype.variables.extend([var_total, var_gain, var_rl, var_a_act, var_a_ng, var_b_act, var_b_ng])
-                            created.add(key)
-
-        return cld.archetypes
\ No newline at end of file
+    @staticmethod
+    def detect_archetypes(graph, node_limit=None, max_per_type=None, max_total=None):
+        """
+        Pure detection phase over an immutable graph snapshot: returns
+        (ArchetypeType, node indices) match tuples and whether a limit dropped
+        matches. With several candidate patterns on a large graph, each
+        pattern is matched on the process pool; results keep the
+        ARCHETYPE_PATTERNS order either way.
+        """
+        # Only the motif counts the patterns check, not the full census
+        bounds = graph.motif_bounds(PATTERN_MOTIFS)
+        candidates = [
+            i for i, pattern in enumerate(ARCHETYPE_PATTERNS)
+            if pattern.could_match(bounds)
+        ]
+        per_pattern = max_per_type
+        if max_total is not None:
+            per_pattern = max_total if per_pattern is None else min(per_pattern, max_total)
+        tasks = [(graph, i, node_limit, per_pattern) for i in candidates]
+
+        if len(candidates) > 1 and ANALYSIS_WORKERS > 1 and graph.edge_count >= PARALLEL_MIN_EDGES:
+            try:
+                pool = _get_process_pool()
+                futures = [pool.submit(_match_archetype_pattern, *task) for task in tasks]
+                results = [future.result() for future in futures]
+            except BrokenProcessPool:
+                # A worker died; drop the pool and fall back to in-process matching
+                _reset_process_pool()
+                results = [_match_archetype_pattern(*task) for task in tasks]
+        else:
+            results = [_match_archetype_pattern(*task) for task in tasks]
+
+        matches = []
+        truncated = False
+        for i, (_, _, seconds) in zip(candidates, results):
+            ANALYSIS_ARCHETYPE_DETECTOR_SECONDS.observe(seconds, archetype=ARCHETYPE_PATTERNS[i].archetype_type.name)
+        for i, (pattern_matches, pattern_truncated, _) in zip(candidates, results):
+            truncated = truncated or pattern_truncated
+            for members in pattern_matches:
+                if max_total is not None and len(matches) >= max_total:
+                    return matches, True
+                matches.append((ARCHETYPE_PATTERNS[i].archetype_type, members))
+        return matches, truncated
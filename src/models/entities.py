@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SqlEnum, Date, Text, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum as SqlEnum, Date, DateTime, Text, Table, Index, LargeBinary, func, literal_column
+from sqlalchemy.orm import relationship, deferred
 import enum
-from datetime import date
+from datetime import date, datetime
 import uuid
 import networkx as nx
 from .. import db
@@ -25,6 +25,12 @@ class ArchetypeType(enum.Enum):
     ESCALATION = "Escalation"
     TRAGEDY_OF_THE_COMMONS = "Tragedy of the Commons"
 
+class JobStatus(enum.Enum):
+    PENDING = "Pending"
+    RUNNING = "Running"
+    SUCCEEDED = "Succeeded"
+    FAILED = "Failed"
+
 relationship_type_enum = SqlEnum(
     RelationshipType,
     name="relationship_type",
@@ -49,23 +55,33 @@ archetype_type_enum = SqlEnum(
     values_callable=lambda enum_cls: [e.name for e in enum_cls],  # FIXES_THAT_FAIL etc
 )
 
+# Stored as VARCHAR, so new statuses need no database type migration
+job_status_enum = SqlEnum(
+    JobStatus,
+    name="job_status",
+    native_enum=False,
+    length=16,
+    values_callable=lambda enum_cls: [e.name for e in enum_cls],  # PENDING/RUNNING etc
+)
+
 # Association Tables
 cld_variables = Table(
     'cld_variables', db.metadata,
     Column('cld_id', String, ForeignKey('clds.id', ondelete='CASCADE'), primary_key=True),
-    Column('variable_id', String, ForeignKey('variables.id', ondelete='RESTRICT'), primary_key=True)
+    Column('variable_id', String, ForeignKey('variables.id', ondelete='RESTRICT'), primary_key=True, index=True)
 )
 
 feedback_loop_variables = Table(
     'feedback_loop_variables', db.metadata,
     Column('feedback_loop_id', String, ForeignKey('feedback_loops.id', ondelete='CASCADE'), primary_key=True),
-    Column('variable_id', String, ForeignKey('variables.id', ondelete='RESTRICT'), primary_key=True)
+    Column('variable_id', String, ForeignKey('variables.id', ondelete='RESTRICT'), primary_key=True, index=True),
+    Column('position', Integer)  # order of the variable along the loop
 )
 
 archetype_variables = Table(
     'archetype_variables', db.metadata,
     Column('archetype_id', String, ForeignKey('archetypes.id', ondelete='CASCADE'), primary_key=True),
-    Column('variable_id', String, ForeignKey('variables.id', ondelete='RESTRICT'), primary_key=True)
+    Column('variable_id', String, ForeignKey('variables.id', ondelete='RESTRICT'), primary_key=True, index=True)
 )
 
 # Models
@@ -82,6 +98,16 @@ class User(db.Model):
 
 class Variable(db.Model):
     __tablename__ = 'variables'
+    __table_args__ = (
+        Index('uq_variables_user_id_name', 'user_id', 'name', unique=True),
+        # Keyset pagination of the variable listing
+        Index('ix_variables_user_id_name_id', 'user_id', 'name', 'id'),
+        # Case-insensitive name prefix filter (lower(name) LIKE 'abc%')
+        Index(
+            'ix_variables_user_id_lower_name', 'user_id', func.lower(literal_column('name')).label('lower_name'),
+            postgresql_ops={'lower_name': 'text_pattern_ops'}
+        ),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String, nullable=False)
@@ -92,12 +118,40 @@ class Variable(db.Model):
 
 class CLD(db.Model):
     __tablename__ = 'clds'
+    __table_args__ = (
+        # Keyset pagination of the CLD listing
+        Index('ix_clds_user_id_name_id', 'user_id', 'name', 'id'),
+        Index('ix_clds_user_id_date_id', 'user_id', 'date', 'id'),
+        # Case-insensitive name prefix filter (lower(name) LIKE 'abc%')
+        Index(
+            'ix_clds_user_id_lower_name', 'user_id', func.lower(literal_column('name')).label('lower_name'),
+            postgresql_ops={'lower_name': 'text_pattern_ops'}
+        ),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String, nullable=False)
     description = Column(Text)
     date = Column(Date, default=date.today)
     user_id = Column(String, ForeignKey('users.id'))
+    # Fingerprints of the graph and parameters the stored results were computed for
+    feedback_loops_fingerprint = Column(String(64))
+    feedback_loops_truncated = Column(Boolean, default=False)
+    # Bounds of the analysis that stored the loops, reused when maintaining them
+    feedback_loops_max_length = Column(Integer)
+    feedback_loops_max_loops = Column(Integer)
+    archetypes_fingerprint = Column(String(64))
+    archetypes_truncated = Column(Boolean, default=False)
+    # Summary counts for the CLD listing, kept up to date by every write to the CLD
+    variable_count = Column(Integer, default=0)
+    relationship_count = Column(Integer, default=0)
+    reinforcing_loop_count = Column(Integer, default=0)
+    balancing_loop_count = Column(Integer, default=0)
+    archetype_count = Column(Integer, default=0)
+    last_analyzed_at = Column(DateTime)
+    # CompactGraph.to_snapshot of the variables and relationships, rewritten in
+    # the transaction of every change to them; loaded only when asked for
+    graph_snapshot = deferred(Column(LargeBinary))
 
     user = relationship("User", back_populates="clds")
     variables = relationship('Variable', secondary=cld_variables)
@@ -118,10 +172,10 @@ class Relationship(db.Model):
     __tablename__ = 'relationships'
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    source_id = Column(String, ForeignKey('variables.id', ondelete='RESTRICT'), nullable=False)
-    target_id = Column(String, ForeignKey('variables.id', ondelete='RESTRICT'), nullable=False)
+    source_id = Column(String, ForeignKey('variables.id', ondelete='RESTRICT'), nullable=False, index=True)
+    target_id = Column(String, ForeignKey('variables.id', ondelete='RESTRICT'), nullable=False, index=True)
     type = Column(relationship_type_enum, nullable=False)
-    cld_id = Column(String, ForeignKey('clds.id', ondelete='CASCADE'), nullable=False)
+    cld_id = Column(String, ForeignKey('clds.id', ondelete='CASCADE'), nullable=False, index=True)
 
     cld = relationship('CLD', back_populates='relationships')
 
@@ -130,17 +184,39 @@ class FeedbackLoop(db.Model):
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     type = Column(loop_type_enum, nullable=False)
-    cld_id = Column(String, ForeignKey('clds.id', ondelete='CASCADE'), nullable=False)
+    cld_id = Column(String, ForeignKey('clds.id', ondelete='CASCADE'), nullable=False, index=True)
 
     cld = relationship('CLD', back_populates='feedback_loops', passive_deletes=True)
-    variables = relationship('Variable', secondary=feedback_loop_variables)
+    variables = relationship(
+        'Variable',
+        secondary=feedback_loop_variables,
+        order_by=feedback_loop_variables.c.position
+    )
 
 class Archetype(db.Model):
     __tablename__ = 'archetypes'
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     type = Column(archetype_type_enum, nullable=False)
-    cld_id = Column(String, ForeignKey('clds.id', ondelete='CASCADE'), nullable=False)
+    cld_id = Column(String, ForeignKey('clds.id', ondelete='CASCADE'), nullable=False, index=True)
 
     cld = relationship('CLD', back_populates='archetypes', passive_deletes=True)
-    variables = relationship('Variable', secondary=archetype_variables)
\ No newline at end of file
+    variables = relationship('Variable', secondary=archetype_variables)
+
+class AnalysisJob(db.Model):
+    __tablename__ = 'analysis_jobs'
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    type = Column(String(32), nullable=False)  # 'feedback_loops' or 'archetypes'
+    status = Column(job_status_enum, nullable=False, default=JobStatus.PENDING)
+    progress = Column(Integer, nullable=False, default=0)  # percent
+    params = Column(Text)  # JSON analysis parameters
+    result = Column(Text)  # JSON response payload once SUCCEEDED
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)  # last progress report of the worker running it
+    attempts = Column(Integer, nullable=False, default=0)  # times the job was claimed
+    cld_id = Column(String, ForeignKey('clds.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(String, ForeignKey('users.id'), nullable=False)
@@ -0,0 +1,613 @@
+import sys
+import time
+import struct
+from array import array
+from collections import defaultdict
+
+# Edge polarity as stored in CompactGraph sign buffers
+POSITIVE = 1
+NEGATIVE = -1
+
+# Searches given a deadline check the clock once per this many steps
+DEADLINE_CHECK_INTERVAL = 1024
+
+# Serialized graph snapshots: magic, format version, node count, variable
+# count, edge count and byte length of the node label table, little-endian
+SNAPSHOT_MAGIC = b'CLDG'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('<4sBIIII')
+_LABEL_SEPARATOR = '\0'
+
+class CompactGraph:
+    """
+    Immutable, integer-indexed snapshot of a signed directed graph.
+
+    Nodes are mapped to dense ints 0..n-1 (`node_ids[i]` is the original
+    label, `index[label]` the reverse). Adjacency is stored CSR-style in
+    `array` buffers for both directions, with the edge polarity (+1/-1) in a
+    parallel signed byte array:
+        out_targets[out_offsets[u]:out_offsets[u + 1]]  successors of u
+        out_signs  [out_offsets[u]:out_offsets[u + 1]]  their polarity
+    and likewise in_sources/in_signs for predecessors. Each row holds its
+    negative edges first; `out_split[u]` / `in_split[u]` is where the
+    positive ones start, so polarity-specific neighbor lists are slices.
+    """
+
+    __slots__ = (
+        'node_ids', 'index',
+        'out_offsets', 'out_targets', 'out_signs', 'out_split',
+        'in_offsets', 'in_sources', 'in_signs', 'in_split',
+        '_edge_signs',
+    )
+
+    def __init__(self, node_ids, edges):
+        """
+        node_ids : sequence of node labels, position = dense index
+        edges    : iterable of (source_index, target_index, sign); when an
+                   edge is repeated the last polarity wins
+        """
+        node_ids = tuple(node_ids)
+        n = len(node_ids)
+
+        edge_signs = {}
+        for u, v, sign in edges:
+            edge_signs[u * n + v] = sign
+
+        out_rows = [[] for _ in range(n)]
+        in_rows = [[] for _ in range(n)]
+        for key in sorted(edge_signs):
+            u, v = divmod(key, n)
+            out_rows[u].append((v, edge_signs[key]))
+            in_rows[v].append((u, edge_signs[key]))
+
+        self.node_ids = node_ids
+        self.index = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.out_offsets, self.out_targets, self.out_signs, self.out_split = self._pack(out_rows)
+        self.in_offsets, self.in_sources, self.in_signs, self.in_split = self._pack(in_rows)
+        self._edge_signs = edge_signs
+
+    @staticmethod
+    def _pack(rows):
+        offsets = array('I', [0])
+        targets = array('I')
+        signs = array('b')
+        split = array('I')
+        for row in rows:
+            row.sort(key=lambda edge: (edge[1], edge[0]))
+            split.append(len(targets) + sum(1 for _, sign in row if sign == NEGATIVE))
+            for node, sign in row:
+                targets.append(node)
+                signs.append(sign)
+            offsets.append(len(targets))
+        return offsets, targets, signs, split
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_edge_signs'):
+            raise AttributeError("CompactGraph is immutable")
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            object.__setattr__(self, slot, value)
+
+    @classmethod
+    def from_triples(cls, node_ids, triples):
+        """
+        Builds a graph from (source_id, target_id, sign) triples. `sign` may be
+        +1/-1 or a RelationshipType. Endpoints missing from `node_ids` are
+        appended to the node table.
+        """
+        node_ids = list(node_ids)
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        edges = []
+        for source_id, target_id, sign in triples:
+            for node_id in (source_id, target_id):
+                if node_id not in index:
+                    index[node_id] = len(node_ids)
+                    node_ids.append(node_id)
+            edges.append((index[source_id], index[target_id], _as_sign(sign)))
+        return cls(node_ids, edges)
+
+    @classmethod
+    def from_cld(cls, cld):
+        """Snapshot of a CLD: its variables first, in order, then its relationships."""
+        return cls.from_triples(
+            [var.id for var in cld.variables],
+            ((rel.source_id, rel.target_id, rel.type) for rel in cld.relationships)
+        )
+
+    def to_snapshot(self, variable_count=None):
+        """
+        Serializes the graph to bytes for storage: a fixed header, the node
+        labels (strings) and the raw CSR buffers, so from_snapshot restores
+        it without re-sorting edges. `variable_count` (default: all nodes)
+        is kept alongside, as the first nodes of a CLD graph are its
+        variables.
+        """
+        if variable_count is None:
+            variable_count = self.n
+        labels = _LABEL_SEPARATOR.join(self.node_ids).encode()
+        parts = [_SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.n, variable_count, self.edge_count, len(labels)
+        ), labels]
+        for buffer in self._buffers():
+            if sys.byteorder == 'big' and buffer.itemsize > 1:
+                buffer = array(buffer.typecode, buffer)
+                buffer.byteswap()
+            parts.append(buffer.tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_snapshot(cls, data):
+        """
+        Restores a graph serialized by to_snapshot. Returns (graph,
+        variable_count); raises ValueError on data it cannot read.
+        """
+        data = bytes(data)
+        try:
+            magic, version, n, variable_count, edge_count, labels_size = _SNAPSHOT_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("Graph snapshot is truncated")
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("Unsupported graph snapshot format")
+
+        position = _SNAPSHOT_HEADER.size
+        labels = data[position:position + labels_size].decode()
+        node_ids = tuple(labels.split(_LABEL_SEPARATOR)) if n else ()
+        position += labels_size
+        if len(node_ids) != n:
+            raise ValueError("Graph snapshot node table does not match its header")
+
+        buffers = []
+        for typecode, length in (
+            ('I', n + 1), ('I', edge_count), ('b', edge_count), ('I', n),
+        ) * 2:
+            buffer = array(typecode)
+            end = position + length * buffer.itemsize
+            if end > len(data):
+                raise ValueError("Graph snapshot is truncated")
+            buffer.frombytes(data[position:end])
+            if sys.byteorder == 'big' and buffer.itemsize > 1:
+                buffer.byteswap()
+            buffers.append(buffer)
+            position = end
+
+        out_offsets, out_targets, out_signs = buffers[:3]
+        edge_signs = {}
+        for u in range(n):
+            base = u * n
+            for i in range(out_offsets[u], out_offsets[u + 1]):
+                edge_signs[base + out_targets[i]] = out_signs[i]
+
+        graph = cls.__new__(cls)
+        graph.__setstate__(
+            (node_ids, {node_id: i for i, node_id in enumerate(node_ids)}) + tuple(buffers) + (edge_signs,)
+        )
+        return graph, variable_count
+
+    def _buffers(self):
+        return (
+            self.out_offsets, self.out_targets, self.out_signs, self.out_split,
+            self.in_offsets, self.in_sources, self.in_signs, self.in_split,
+        )
+
+    @property
+    def n(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.out_targets)
+
+    def successors(self, u, sign=None):
+        """Targets of the edges leaving u, optionally only those of one polarity."""
+        return self._row(self.out_offsets, self.out_targets, self.out_split, u, sign)
+
+    def predecessors(self, u, sign=None):
+        """Sources of the edges entering u, optionally only those of one polarity."""
+        return self._row(self.in_offsets, self.in_sources, self.in_split, u, sign)
+
+    @staticmethod
+    def _row(offsets, nodes, split, u, sign):
+        if sign is None:
+            return nodes[offsets[u]:offsets[u + 1]]
+        if sign == NEGATIVE:
+            return nodes[offsets[u]:split[u]]
+        return nodes[split[u]:offsets[u + 1]]
+
+    def sign(self, u, v):
+        """Polarity of the edge u -> v, or None when there is no such edge."""
+        return self._edge_signs.get(u * len(self.node_ids) + v)
+
+    def edges(self):
+        """Yields (source, target, sign) for every edge."""
+        offsets, targets, signs = self.out_offsets, self.out_targets, self.out_signs
+        for u in range(len(self.node_ids)):
+            for i in range(offsets[u], offsets[u + 1]):
+                yield u, targets[i], signs[i]
+
+    def subgraph(self, nodes):
+        """
+        Induced subgraph on `nodes`. Its node labels are the indices of this
+        graph, so `sub.node_ids[i]` maps a subgraph node back to the parent.
+        """
+        nodes = sorted(nodes)
+        local = {u: i for i, u in enumerate(nodes)}
+        edges = [
+            (local[u], local[v], s)
+            for u in nodes
+            for v, s in zip(*self._out_row(u))
+            if v in local
+        ]
+        return CompactGraph(nodes, edges)
+
+    def _out_row(self, u):
+        start, end = self.out_offsets[u], self.out_offsets[u + 1]
+        return self.out_targets[start:end], self.out_signs[start:end]
+
+    def strongly_connected_components(self, nodes=None):
+        """
+        Tarjan's algorithm (iterative), optionally restricted to the subgraph
+        induced by `nodes`. Returns a list of node lists.
+        """
+        n = len(self.node_ids)
+        if nodes is None:
+            allowed = None
+            roots = range(n)
+        else:
+            allowed = bytearray(n)
+            for u in nodes:
+                allowed[u] = 1
+            roots = sorted(nodes)
+
+        offsets, targets = self.out_offsets, self.out_targets
+        index_of = [-1] * n
+        lowlink = [0] * n
+        on_stack = bytearray(n)
+        stack = []
+        components = []
+        counter = 0
+
+        for root in roots:
+            if index_of[root] != -1:
+                continue
+            work = [(root, offsets[root])]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+
+            while work:
+                u, i = work[-1]
+                end = offsets[u + 1]
+                while i < end:
+                    v = targets[i]
+                    i += 1
+                    if allowed is not None and not allowed[v]:
+                        continue
+                    if index_of[v] == -1:
+                        work[-1] = (u, i)
+                        index_of[v] = lowlink[v] = counter
+                        counter += 1
+                        stack.append(v)
+                        on_stack[v] = 1
+                        work.append((v, offsets[v]))
+                        break
+                    if on_stack[v] and index_of[v] < lowlink[u]:
+                        lowlink[u] = index_of[v]
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        if lowlink[u] < lowlink[parent]:
+                            lowlink[parent] = lowlink[u]
+                    if lowlink[u] == index_of[u]:
+                        component = []
+                        while True:
+                            v = stack.pop()
+                            on_stack[v] = 0
+                            component.append(v)
+                            if v == u:
+                                break
+                        components.append(component)
+
+        return components
+
+    def simple_cycles(self, length_bound=None, deadline=None):
+        """
+        Yields every simple cycle as a list of node indices. Uses Johnson's
+        algorithm, or a depth-bounded search when `length_bound` is given.
+        Each strongly connected component is searched from its smallest node,
+        which is then removed before the remainder is decomposed again.
+        The search stops early, without notice, once `deadline` (a
+        time.monotonic() value) has passed; callers check the clock after.
+        """
+        if length_bound is not None and length_bound < 2:
+            return
+        components = [c for c in self.strongly_connected_components() if len(c) > 1]
+        while components:
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            component = set(components.pop())
+            start = min(component)
+            if length_bound is None:
+                yield from self._johnson_cycles(start, component, deadline)
+            else:
+                yield from self._bounded_cycles(start, component, length_bound, deadline)
+            component.discard(start)
+            components.extend(
+                c for c in self.strongly_connected_components(component) if len(c) > 1
+            )
+
+    def _johnson_cycles(self, start, component, deadline=None):
+        """Cycles through `start` within `component` (Johnson's blocking search)."""
+        offsets, targets = self.out_offsets, self.out_targets
+
+        def neighbors(u):
+            return [v for v in targets[offsets[u]:offsets[u + 1]] if v in component]
+
+        path = [start]
+        blocked = {start}
+        blocked_by = defaultdict(set)
+        closed = [False]
+        stack = [iter(neighbors(start))]
+        steps = 0
+
+        while stack:
+            steps += 1
+            if deadline is not None and steps % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+                return
+            for v in stack[-1]:
+                if v == start:
+                    yield path[:]
+                    closed[-1] = True
+                elif v not in blocked:
+                    path.append(v)
+                    closed.append(False)
+                    stack.append(iter(neighbors(v)))
+                    blocked.add(v)
+                    break
+            else:
+                stack.pop()
+                u = path.pop()
+                if closed.pop():
+                    if closed:
+                        closed[-1] = True
+                    to_unblock = [u]
+                    while to_unblock:
+                        w = to_unblock.pop()
+                        if w in blocked:
+                            blocked.discard(w)
+                            to_unblock.extend(blocked_by.pop(w, ()))
+                else:
+                    for v in neighbors(u):
+                        blocked_by[v].add(u)
+
+    def _bounded_cycles(self, start, component, length_bound, deadline=None):
+        """Cycles through `start` within `component` of at most `length_bound` nodes."""
+        offsets, targets = self.out_offsets, self.out_targets
+
+        def neighbors(u):
+            return [v for v in targets[offsets[u]:offsets[u + 1]] if v in component]
+
+        path = [start]
+        on_path = {start}
+        stack = [iter(neighbors(start))]
+        steps = 0
+
+        while stack:
+            steps += 1
+            if deadline is not None and steps % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+                return
+            for v in stack[-1]:
+                if v == start:
+                    yield path[:]
+                elif v not in on_path and len(path) < length_bound:
+                    path.append(v)
+                    on_path.add(v)
+                    stack.append(iter(neighbors(v)))
+                    break
+            else:
+                stack.pop()
+                on_path.discard(path.pop())
+
+    def simple_paths(self, source, target, length_bound=None, excluded_edges=None, deadline=None):
+        """
+        Yields every simple path source -> ... -> target as a list of node
+        indices, with at most `length_bound` nodes. Edges u -> v whose key
+        `u * n + v` is in `excluded_edges` are ignored. Only nodes that can
+        still reach `target` are expanded. Stops early once `deadline` has
+        passed, like simple_cycles.
+        """
+        n = len(self.node_ids)
+        excluded = excluded_edges or ()
+        in_offsets, in_sources = self.in_offsets, self.in_sources
+
+        # Nodes from which target is reachable (reverse BFS)
+        reaches_target = {target}
+        frontier = [target]
+        while frontier:
+            v = frontier.pop()
+            for u in in_sources[in_offsets[v]:in_offsets[v + 1]]:
+                if u not in reaches_target and u * n + v not in excluded:
+                    reaches_target.add(u)
+                    frontier.append(u)
+        if source not in reaches_target:
+            return
+        if source == target:
+            yield [source]
+            return
+
+        offsets, targets = self.out_offsets, self.out_targets
+
+        def neighbors(u):
+            return [
+                v for v in targets[offsets[u]:offsets[u + 1]]
+                if v in reaches_target and u * n + v not in excluded
+            ]
+
+        path = [source]
+        on_path = {source}
+        stack = [iter(neighbors(source))]
+        steps = 0
+
+        while stack:
+            steps += 1
+            if deadline is not None and steps % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+                return
+            for v in stack[-1]:
+                if v == target:
+                    if length_bound is None or len(path) < length_bound:
+                        yield path + [target]
+                elif v not in on_path and (length_bound is None or len(path) + 1 < length_bound):
+                    path.append(v)
+                    on_path.add(v)
+                    stack.append(iter(neighbors(v)))
+                    break
+            else:
+                stack.pop()
+                on_path.discard(path.pop())
+
+    def motif_census(self):
+        """
+        Counts of the small signed motifs (as subgraphs, not induced), named
+        by the polarities of their edges ('p' positive, 'n' negative):
+            pair_pp, pair_pn, pair_nn          reciprocal pairs u <-> v
+            path_pp, path_pn, path_np, path_nn paths u -> v -> w, u != w
+            cycle_ppp, cycle_ppn, cycle_pnn, cycle_nnn  directed 3-cycles
+        Each node's signed neighbor sets are int bitsets, so the matrix
+        products behind these counts (e.g. trace(A+ A+ A-)) reduce to
+        bitwise ANDs and popcounts.
+        """
+        n = len(self.node_ids)
+        signs = (POSITIVE, NEGATIVE)
+        out_bits = {sign: [0] * n for sign in signs}
+        in_bits = {sign: [0] * n for sign in signs}
+        for u, v, sign in self.edges():
+            out_bits[sign][u] |= 1 << v
+            in_bits[sign][v] |= 1 << u
+
+        census = {name: 0 for name in MOTIFS}
+        for u in range(n):
+            for s1 in signs:
+                for s2 in signs:
+                    # v with u -> v (s1) and v -> u (s2)
+                    reciprocal = _popcount(out_bits[s1][u] & in_bits[s2][u])
+                    census['pair_' + _motif_name(sorted((s1, s2), reverse=True))] += reciprocal
+                    # paths x -> u (s1) -> w (s2), x != w
+                    census['path_' + _motif_name((s1, s2))] += (
+                        _popcount(in_bits[s1][u]) * _popcount(out_bits[s2][u])
+                        - _popcount(in_bits[s1][u] & out_bits[s2][u])
+                    )
+
+        for u, v, s1 in self.edges():
+            for s2 in signs:
+                for s3 in signs:
+                    # w with v -> w (s2) and w -> u (s3); every cycle is seen once per edge
+                    closing = _popcount(out_bits[s2][v] & in_bits[s3][u])
+                    census['cycle_' + _motif_name(sorted((s1, s2, s3), reverse=True))] += closing
+
+        census['pair_pp'] //= 2
+        census['pair_nn'] //= 2
+        census['pair_pn'] //= 2
+        for name in ('cycle_ppp', 'cycle_ppn', 'cycle_pnn', 'cycle_nnn'):
+            census[name] //= 3
+        return census
+
+    def motif_bounds(self, required):
+        """
+        Cheap stand-in for motif_census when only "at least k" matters:
+        counts of the motifs in `required` ({name: k}), each of which may
+        stop early once it reaches k. Reciprocal pairs and 3-cycles are
+        counted exactly up to k, by walking the CSR rows and the edge sign
+        table; paths count degree products, which include u -> v -> u and
+        so can only overcount. Whenever the census has at least k of a
+        motif, the bound does too, which is all ArchetypePattern.could_match
+        needs, at no more than O(n + E) plus the two-step walks from each
+        edge that 3-cycles take.
+        """
+        n = len(self.node_ids)
+        bounds = {name: 0 for name in required}
+        out_offsets, out_targets, out_signs, out_split = (
+            self.out_offsets, self.out_targets, self.out_signs, self.out_split
+        )
+        in_offsets, in_split = self.in_offsets, self.in_split
+        edge_signs = self._edge_signs
+
+        paths = [name for name in required if name.startswith('path_')]
+        if paths:
+            degree_products = {name: 0 for name in paths}
+            for u in range(n):
+                in_degree = {NEGATIVE: in_split[u] - in_offsets[u], POSITIVE: in_offsets[u + 1] - in_split[u]}
+                out_degree = {NEGATIVE: out_split[u] - out_offsets[u], POSITIVE: out_offsets[u + 1] - out_split[u]}
+                for name in paths:
+                    s1, s2 = (POSITIVE if c == 'p' else NEGATIVE for c in name[len('path_'):])
+                    degree_products[name] += in_degree[s1] * out_degree[s2]
+            bounds.update(degree_products)
+
+        # Pairs and 3-cycles are counted once each, from their smallest node
+        short = {name for name in required if name.startswith('pair_') and bounds[name] < required[name]}
+        for u in range(n):
+            if not short:
+                break
+            for i in range(out_offsets[u], out_offsets[u + 1]):
+                v = out_targets[i]
+                reverse = edge_signs.get(v * n + u) if v > u else None
+                if reverse is not None:
+                    name = 'pair_' + _motif_name(sorted((out_signs[i], reverse), reverse=True))
+                    if name in short:
+                        bounds[name] += 1
+                        if bounds[name] >= required[name]:
+                            short.discard(name)
+
+        short = {name for name in required if name.startswith('cycle_') and bounds[name] < required[name]}
+        for u in range(n):
+            if not short:
+                break
+            for i in range(out_offsets[u], out_offsets[u + 1]):
+                v = out_targets[i]
+                if v < u:
+                    continue
+                for j in range(out_offsets[v], out_offsets[v + 1]):
+                    w = out_targets[j]
+                    closing = edge_signs.get(w * n + u) if w > u else None
+                    if closing is None:
+                        continue
+                    name = 'cycle_' + _motif_name(sorted((out_signs[i], out_signs[j], closing), reverse=True))
+                    if name in short:
+                        bounds[name] += 1
+                        if bounds[name] >= required[name]:
+                            short.discard(name)
+        return bounds
+
+    def edge_key(self, u, v):
+        """Integer key of the edge u -> v, as used by `excluded_edges`."""
+        return u * len(self.node_ids) + v
+
+    def cycle_sign(self, cycle):
+        """Product of the edge polarities along a cycle (+1 reinforcing, -1 balancing)."""
+        sign = POSITIVE
+        for i, u in enumerate(cycle):
+            sign *= self.sign(u, cycle[(i + 1) % len(cycle)])
+        return sign
+
+MOTIFS = (
+    'pair_pp', 'pair_pn', 'pair_nn',
+    'path_pp', 'path_pn', 'path_np', 'path_nn',
+    'cycle_ppp', 'cycle_ppn', 'cycle_pnn', 'cycle_nnn',
+)
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+def _motif_name(edge_signs):
+    return ''.join('p' if sign == POSITIVE else 'n' for sign in edge_signs)
+
+def _as_sign(value):
+    """Maps a RelationshipType (or +1/-1) to a polarity constant."""
+    if value in (POSITIVE, NEGATIVE):
+        return value
+    return NEGATIVE if value.name == 'NEGATIVE' else POSITIVE
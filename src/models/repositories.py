@@ -1,8 +1,67 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select
-from .entities import User, Variable, CLD, Relationship, RelationshipType
+import uuid
+import json
+import base64
+from datetime import datetime, date, timedelta
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, insert, update, delete, func, tuple_, union
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .entities import (
+    User, Variable, CLD, Relationship, RelationshipType, LoopType, FeedbackLoop, Archetype,
+    AnalysisJob, JobStatus, cld_variables, feedback_loop_variables, archetype_variables
+)
 from werkzeug.security import generate_password_hash, check_password_hash
 
+def _encode_cursor(sort_value, row_id):
+    """Opaque page cursor holding the sort key of the last row returned."""
+    if isinstance(sort_value, date):
+        sort_value = sort_value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return sort_value, row_id
+
+def _name_prefix(column, prefix):
+    """
+    Case-insensitive `column` starts with `prefix` (LIKE wildcards in it are
+    literal). Written as lower(column) LIKE lower(prefix) || '%', which the
+    (user_id, lower(name) text_pattern_ops) indexes serve as a range scan;
+    ILIKE can't use a btree index.
+    """
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return func.lower(column).like(func.lower(escaped).concat('%'), escape='\\')
+
+def _keyset_page(db: Session, query, model, sort_column, descending, limit, cursor=None, parse_value=None):
+    """
+    One page of `query` ordered by (sort_column, id), starting after
+    `cursor`. Seeks on the (user_id, sort column, id) indexes instead of
+    using OFFSET, so deep pages cost the same as the first one. Returns up
+    to `limit` rows and the cursor of the next page (None on the last page).
+    """
+    position = tuple_(sort_column, model.id)
+    if cursor is not None:
+        sort_value, last_id = _decode_cursor(cursor)
+        if parse_value is not None:
+            try:
+                sort_value = parse_value(sort_value)
+            except (ValueError, TypeError):
+                raise ValueError("Invalid cursor")
+        query = query.where(position < (sort_value, last_id) if descending else position > (sort_value, last_id))
+    if descending:
+        query = query.order_by(sort_column.desc(), model.id.desc())
+    else:
+        query = query.order_by(sort_column, model.id)
+    rows = db.scalars(query.limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(getattr(rows[-1], sort_column.key), rows[-1].id)
+    return rows, next_cursor
+
 class UserRepository:
     @staticmethod
     def register_user(db: Session, name, email, password):
@@ -37,10 +96,96 @@ class VariableRepository:
         db.refresh(new_variable)
         return new_variable
 
+    @staticmethod
+    def create_variables(db: Session, user_id, variables):
+        """
+        Inserts `variables`, (name, description) pairs with distinct names,
+        in one multi-row INSERT ... ON CONFLICT DO NOTHING. Returns {name: id}
+        of the variables created; names the user already has are skipped.
+        The caller commits.
+        """
+        if not variables:
+            return {}
+        rows = db.execute(
+            pg_insert(Variable)
+            .values([
+                {'id': str(uuid.uuid4()), 'user_id': user_id, 'name': name, 'description': description}
+                for name, description in variables
+            ])
+            .on_conflict_do_nothing(index_elements=['user_id', 'name'])
+            .returning(Variable.id, Variable.name)
+        ).all()
+        return {name: variable_id for variable_id, name in rows}
+
+    @staticmethod
+    def get_user_variable_ids_by_names(db: Session, user_id, names):
+        """{name: id} of the user's variables among `names`, in one IN query."""
+        if not names:
+            return {}
+        rows = db.execute(
+            select(Variable.name, Variable.id).where(Variable.user_id == user_id, Variable.name.in_(set(names)))
+        ).all()
+        return dict(rows)
+
+    @staticmethod
+    def update_variables(db: Session, changes):
+        """
+        Applies `changes`, dicts with 'id' and the columns to set, as one
+        executemany UPDATE by primary key. The caller checks ownership and
+        name conflicts, and commits.
+        """
+        if changes:
+            db.execute(update(Variable), changes)
+
+    @staticmethod
+    def get_variable_ids_in_use(db: Session, variable_ids):
+        """The ids among `variable_ids` referenced by a CLD, relationship, loop or archetype."""
+        if not variable_ids:
+            return set()
+        variable_ids = set(variable_ids)
+        return set(db.scalars(union(
+            select(cld_variables.c.variable_id).where(cld_variables.c.variable_id.in_(variable_ids)),
+            select(Relationship.source_id).where(Relationship.source_id.in_(variable_ids)),
+            select(Relationship.target_id).where(Relationship.target_id.in_(variable_ids)),
+            select(feedback_loop_variables.c.variable_id).where(feedback_loop_variables.c.variable_id.in_(variable_ids)),
+            select(archetype_variables.c.variable_id).where(archetype_variables.c.variable_id.in_(variable_ids))
+        )).all())
+
+    @staticmethod
+    def delete_variables(db: Session, user_id, variable_ids):
+        """Deletes the user's variables in `variable_ids` with one DELETE. The caller commits."""
+        if variable_ids:
+            db.execute(
+                delete(Variable).where(Variable.user_id == user_id, Variable.id.in_(set(variable_ids))),
+                execution_options={'synchronize_session': False}
+            )
+
     @staticmethod
     def get_user_variables(db: Session, user_id):
         return db.scalars(select(Variable).where(Variable.user_id == user_id)).all()
 
+    @staticmethod
+    def get_user_variables_page(db: Session, user_id, limit, sort='name', prefix=None, cursor=None):
+        """
+        One page of the user's variables sorted by name ('-name' for
+        descending), optionally only names starting with `prefix`. Returns
+        (variables, next cursor); raises ValueError on a bad cursor.
+        """
+        query = select(Variable).where(Variable.user_id == user_id)
+        if prefix:
+            query = query.where(_name_prefix(Variable.name, prefix))
+        return _keyset_page(db, query, Variable, Variable.name, sort.startswith('-'), limit, cursor)
+
+    @staticmethod
+    def get_user_variables_by_ids(db: Session, user_id, variable_ids):
+        """The user's variables among `variable_ids`, by id, in one IN query."""
+        if not variable_ids:
+            return {}
+        variables = db.scalars(
+            select(Variable).where(Variable.user_id == user_id, Variable.id.in_(set(variable_ids)))
+        ).all()
+        return {variable.id: variable for variable in variables}
+
     @staticmethod
     def get_all_variables(db: Session):
         return db.query(Variable).all()
@@ -75,14 +220,94 @@ class CLDRepository:
         db.refresh(new_cld)
         return new_cld
 
+    @staticmethod
+    def create_cld_with_contents(db: Session, user_id: str, name: str, date, description: str,
+                                 variable_ids, relationships, graph_snapshot=None):
+        """
+        Creates a CLD with its variables and relationships using one
+        multi-row insert per table. `relationships` are (source id, target
+        id, RelationshipType) triples, deduplicated like sync_relationships
+        does. The caller validates the input and commits.
+        """
+        variable_ids = list(dict.fromkeys(variable_ids))
+        relationships = RelationshipRepository.unique_edges(relationships)
+        new_cld = CLD(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            name=name,
+            date=date,
+            description=description,
+            variable_count=len(variable_ids),
+            relationship_count=len(relationships),
+            graph_snapshot=graph_snapshot
+        )
+        db.add(new_cld)
+        db.flush()
+        if variable_ids:
+            db.execute(insert(cld_variables), [
+                {'cld_id': new_cld.id, 'variable_id': var_id} for var_id in variable_ids
+            ])
+        if relationships:
+            db.execute(insert(Relationship), [
+                {
+                    'id': str(uuid.uuid4()),
+                    'cld_id': new_cld.id,
+                    'source_id': source_id,
+                    'target_id': target_id,
+                    'type': rel_type
+                }
+                for source_id, target_id, rel_type in relationships
+            ])
+        return new_cld
+
     @staticmethod
     def get_user_clds(db: Session, user_id):
         return db.query(CLD).filter(CLD.user_id == user_id).all()
 
+    @staticmethod
+    def get_user_clds_page(db: Session, user_id, limit, sort='name', prefix=None, cursor=None):
+        """
+        One page of the user's CLDs sorted by 'name' or 'date' (prefixed
+        with '-' for descending), optionally only names starting with
+        `prefix`. Returns (clds, next cursor); raises ValueError on a bad
+        cursor.
+        """
+        query = select(CLD).where(CLD.user_id == user_id)
+        if prefix:
+            query = query.where(_name_prefix(CLD.name, prefix))
+        if sort.lstrip('-') == 'date':
+            return _keyset_page(
+                db, query, CLD, CLD.date, sort.startswith('-'), limit, cursor, parse_value=date.fromisoformat
+            )
+        return _keyset_page(db, query, CLD, CLD.name, sort.startswith('-'), limit, cursor)
+
     @staticmethod
     def get_cld_by_user(db: Session, cld_id, user_id):
         return db.query(CLD).filter(CLD.id == cld_id, CLD.user_id == user_id).first()
 
+    @staticmethod
+    def get_graph_snapshot(db: Session, cld_id):
+        """The stored graph snapshot of the CLD (a single column fetch), or None."""
+        return db.scalar(select(CLD.graph_snapshot).where(CLD.id == cld_id))
+
+    @staticmethod
+    def get_cld_aggregate_by_user(db: Session, cld_id, user_id):
+        """
+        The CLD with everything _format_cld reads (variables, relationships,
+        loops and archetypes with their variables) loaded up front, in a
+        fixed number of SELECTs however many loops and archetypes it has.
+        """
+        return db.scalar(
+            select(CLD)
+            .where(CLD.id == cld_id, CLD.user_id == user_id)
+            .options(
+                selectinload(CLD.variables),
+                selectinload(CLD.relationships),
+                selectinload(CLD.feedback_loops).selectinload(FeedbackLoop.variables),
+                selectinload(CLD.archetypes).selectinload(Archetype.variables)
+            )
+        )
+
     @staticmethod
     def update_cld(db: Session, cld_id: str, user_id: str, name: str = None, description: str = None, date = None):
         cld = db.query(CLD).filter(CLD.id == cld_id, CLD.user_id == user_id).first()
@@ -97,6 +322,34 @@ class CLDRepository:
             db.refresh(cld)
         return cld
 
+    @staticmethod
+    def refresh_summary(db: Session, cld, variables=False, relationships=False, feedback_loops=False, archetypes=False):
+        """
+        Recounts the selected parts of the CLD into its summary columns, in
+        the caller's transaction (pending changes are flushed first).
+        """
+        db.flush()
+        if variables:
+            cld.variable_count = db.scalar(
+                select(func.count()).select_from(cld_variables).where(cld_variables.c.cld_id == cld.id)
+            )
+        if relationships:
+            cld.relationship_count = db.scalar(
+                select(func.count(Relationship.id)).where(Relationship.cld_id == cld.id)
+            )
+        if feedback_loops:
+            counts = dict(db.execute(
+                select(FeedbackLoop.type, func.count(FeedbackLoop.id))
+                .where(FeedbackLoop.cld_id == cld.id)
+                .group_by(FeedbackLoop.type)
+            ).all())
+            cld.reinforcing_loop_count = counts.get(LoopType.REINFORCING, 0)
+            cld.balancing_loop_count = counts.get(LoopType.BALANCING, 0)
+        if archetypes:
+            cld.archetype_count = db.scalar(
+                select(func.count(Archetype.id)).where(Archetype.cld_id == cld.id)
+            )
+
     @staticmethod
     def delete_cld(db: Session, cld_id: str, user_id: str):
         cld = db.query(CLD).filter(CLD.id == cld_id, CLD.user_id == user_id).first()
@@ -122,4 +375,339 @@ class RelationshipRepository:
 
     @staticmethod
     def get_relationships_by_cld(db: Session, cld_id):
-        return db.query(Relationship).filter_by(cld_id=cld_id).all() 
\ No newline at end of file
+        return db.query(Relationship).filter_by(cld_id=cld_id).all()
+
+    @staticmethod
+    def unique_edges(triples):
+        """
+        (source id, target id, RelationshipType) triples with one per edge,
+        in order of first appearance; when an edge is given twice, the last
+        polarity wins.
+        """
+        edges = {}
+        for source_id, target_id, rel_type in triples:
+            edges[(source_id, target_id)] = rel_type
+        return [(source_id, target_id, rel_type) for (source_id, target_id), rel_type in edges.items()]
+
+    @staticmethod
+    def sync_relationships(db: Session, cld, triples):
+        """
+        Makes the CLD relationships match `triples`, (source id, target id,
+        RelationshipType), touching only what changed: new edges are added,
+        missing ones removed and edges whose polarity changed are updated in
+        place, so unchanged relationships keep their IDs. When an edge is
+        given twice, the last polarity wins. Returns (added, updated, removed)
+        Relationship lists; the changes are flushed, not committed.
+        """
+        submitted = {
+            (source_id, target_id): rel_type for source_id, target_id, rel_type in RelationshipRepository.unique_edges(triples)
+        }
+
+        added, updated, removed = [], [], []
+        kept = set()
+        for rel in list(cld.relationships):
+            edge = (rel.source_id, rel.target_id)
+            if edge not in submitted or edge in kept:
+                removed.append(rel)
+                cld.relationships.remove(rel)
+                continue
+            kept.add(edge)
+            if rel.type != submitted[edge]:
+                rel.type = submitted[edge]
+                updated.append(rel)
+
+        for (source_id, target_id), rel_type in submitted.items():
+            if (source_id, target_id) not in kept:
+                rel = Relationship(
+                    id=str(uuid.uuid4()),
+                    source_id=source_id,
+                    target_id=target_id,
+                    type=rel_type
+                )
+                cld.relationships.append(rel)
+                added.append(rel)
+
+        db.flush()
+        return added, updated, removed
+
+class AnalysisRepository:
+    """
+    Set-based persistence of analysis results. Results are written with one
+    executemany per table instead of one ORM object per loop/archetype. The
+    caller owns the transaction (nothing is committed here).
+    """
+
+    @staticmethod
+    def replace_feedback_loops(db: Session, cld_id: str, loops):
+        """Replaces the CLD feedback loops with `loops`, a list of (LoopType, variable ids)."""
+        AnalysisRepository._delete_results(db, FeedbackLoop, feedback_loop_variables.c.feedback_loop_id, cld_id)
+        return AnalysisRepository._insert_results(
+            db, FeedbackLoop, feedback_loop_variables, 'feedback_loop_id', cld_id, loops
+        )
+
+    @staticmethod
+    def replace_archetypes(db: Session, cld_id: str, archetypes):
+        """Replaces the CLD archetypes with `archetypes`, a list of (ArchetypeType, variable ids)."""
+        AnalysisRepository._delete_results(db, Archetype, archetype_variables.c.archetype_id, cld_id)
+        return AnalysisRepository._insert_results(
+            db, Archetype, archetype_variables, 'archetype_id', cld_id, archetypes
+        )
+
+    @staticmethod
+    def _delete_results(db: Session, model, owner_column, cld_id):
+        owned_ids = select(model.id).where(model.cld_id == cld_id)
+        db.execute(delete(owner_column.table).where(owner_column.in_(owned_ids)))
+        db.execute(delete(model).where(model.cld_id == cld_id), execution_options={'synchronize_session': False})
+
+    @staticmethod
+    def _insert_results(db: Session, model, association, owner_key, cld_id, results):
+        rows = []
+        association_rows = []
+        formatted = []
+        for result_type, variable_ids in results:
+            result_id = str(uuid.uuid4())
+            variable_ids = list(dict.fromkeys(variable_ids))
+            rows.append({'id': result_id, 'type': result_type, 'cld_id': cld_id})
+            association_rows.extend(
+                AnalysisRepository._association_row(association, owner_key, result_id, var_id, position)
+                for position, var_id in enumerate(variable_ids)
+            )
+            formatted.append({'id': result_id, 'type': result_type.name, 'variables': variable_ids})
+
+        if rows:
+            db.execute(insert(model), rows)
+            db.execute(insert(association), association_rows)
+        return formatted
+
+    @staticmethod
+    def _association_row(association, owner_key, owner_id, variable_id, position):
+        row = {owner_key: owner_id, 'variable_id': variable_id}
+        if 'position' in association.c:
+            row['position'] = position
+        return row
+
+    @staticmethod
+    def get_archetypes_page(db: Session, cld_id: str, limit=None, cursor=None):
+        """
+        Stored archetypes of a CLD ordered by id, starting after the `cursor`
+        id. Returns up to `limit` formatted archetypes and the cursor of the
+        next page (None on the last page).
+        """
+        query = select(Archetype.id, Archetype.type).where(Archetype.cld_id == cld_id)
+        if cursor is not None:
+            query = query.where(Archetype.id > cursor)
+        query = query.order_by(Archetype.id)
+        if limit is not None:
+            query = query.limit(limit + 1)
+        rows = db.execute(query).all()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1].id
+
+        archetypes = {
+            archetype_id: {'id': archetype_id, 'type': archetype_type.name, 'variables': []}
+            for archetype_id, archetype_type in rows
+        }
+        if archetypes:
+            members = db.execute(
+                select(archetype_variables.c.archetype_id, archetype_variables.c.variable_id)
+                .where(archetype_variables.c.archetype_id.in_(list(archetypes)))
+            ).all()
+            for archetype_id, variable_id in members:
+                archetypes[archetype_id]['variables'].append(variable_id)
+        return list(archetypes.values()), next_cursor
+
+    @staticmethod
+    def get_feedback_loops(db: Session, cld_id: str):
+        """
+        Stored loops of a CLD as (loop id, LoopType, variable ids in cycle
+        order). Returns None when some loop was stored without its order.
+        """
+        rows = db.execute(
+            select(
+                FeedbackLoop.id,
+                FeedbackLoop.type,
+                feedback_loop_variables.c.variable_id,
+                feedback_loop_variables.c.position
+            )
+            .join(feedback_loop_variables, feedback_loop_variables.c.feedback_loop_id == FeedbackLoop.id)
+            .where(FeedbackLoop.cld_id == cld_id)
+            .order_by(FeedbackLoop.id, feedback_loop_variables.c.position)
+        ).all()
+
+        loops = {}
+        for loop_id, loop_type, variable_id, position in rows:
+            if position is None:
+                return None
+            loops.setdefault(loop_id, (loop_id, loop_type, []))[2].append(variable_id)
+        return list(loops.values())
+
+    @staticmethod
+    def apply_feedback_loop_changes(db: Session, cld_id: str, deleted_ids, retyped, added):
+        """
+        Applies an incremental loop update: deletes the loops in `deleted_ids`,
+        sets the type of each (loop id, LoopType) in `retyped` and inserts the
+        `added` (LoopType, variable ids) loops. Untouched loops keep their rows.
+        """
+        if deleted_ids:
+            db.execute(delete(feedback_loop_variables).where(
+                feedback_loop_variables.c.feedback_loop_id.in_(deleted_ids)
+            ))
+            db.execute(
+                delete(FeedbackLoop).where(FeedbackLoop.id.in_(deleted_ids)),
+                execution_options={'synchronize_session': False}
+            )
+        if retyped:
+            db.execute(
+                update(FeedbackLoop),
+                [{'id': loop_id, 'type': loop_type} for loop_id, loop_type in retyped]
+            )
+        return AnalysisRepository._insert_results(
+            db, FeedbackLoop, feedback_loop_variables, 'feedback_loop_id', cld_id, added
+        )
+
+def _held_by(job_id, attempt):
+    """Conditions for the job still being RUNNING under the claim that returned `attempt`."""
+    return (
+        AnalysisJob.id == job_id,
+        AnalysisJob.status == JobStatus.RUNNING,
+        AnalysisJob.attempts == attempt
+    )
+
+class JobRepository:
+    @staticmethod
+    def create_job(db: Session, user_id, cld_id, job_type, params):
+        job = AnalysisJob(user_id=user_id, cld_id=cld_id, type=job_type, params=json.dumps(params))
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def get_job(db: Session, job_id):
+        return db.scalar(select(AnalysisJob).where(AnalysisJob.id == job_id))
+
+    @staticmethod
+    def get_job_by_user(db: Session, job_id, user_id):
+        return db.scalar(select(AnalysisJob).where(AnalysisJob.id == job_id, AnalysisJob.user_id == user_id))
+
+    @staticmethod
+    def get_pending_job(db: Session, cld_id, job_type, params):
+        """A PENDING job of the CLD with the same type and parameters, or None."""
+        return db.scalar(
+            select(AnalysisJob)
+            .where(
+                AnalysisJob.cld_id == cld_id,
+                AnalysisJob.type == job_type,
+                AnalysisJob.params == json.dumps(params),
+                AnalysisJob.status == JobStatus.PENDING
+            )
+            .limit(1)
+        )
+
+    @staticmethod
+    def get_pending_job_ids(db: Session, limit=None):
+        query = (
+            select(AnalysisJob.id)
+            .where(AnalysisJob.status == JobStatus.PENDING)
+            .order_by(AnalysisJob.created_at)
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        return db.scalars(query).all()
+
+    @staticmethod
+    def claim_job(db: Session, job_id):
+        """
+        Atomically moves a PENDING job to RUNNING. Returns the attempt number
+        of this claim, or None when another worker claimed it first.
+        """
+        now = datetime.utcnow()
+        attempt = db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, AnalysisJob.status == JobStatus.PENDING)
+            .values(
+                status=JobStatus.RUNNING,
+                progress=0,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=AnalysisJob.attempts + 1
+            )
+            .returning(AnalysisJob.attempts)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        db.commit()
+        return attempt
+
+    @staticmethod
+    def set_progress(db: Session, job_id, attempt, progress=None):
+        """
+        Renews the lease of a RUNNING job and records its progress, if given.
+        Returns False, writing nothing, when the claim `attempt` no longer
+        holds the job (it was recovered as stale, or finished).
+        """
+        values = {'heartbeat_at': datetime.utcnow()}
+        if progress is not None:
+            values['progress'] = progress
+        updated = db.execute(
+            update(AnalysisJob)
+            .where(*_held_by(job_id, attempt))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return updated == 1
+
+    @staticmethod
+    def recover_stale_jobs(db: Session, lease_seconds, max_attempts):
+        """
+        RUNNING jobs whose worker has not reported for `lease_seconds` (it
+        crashed or was stopped) go back to PENDING, or to FAILED once they
+        have been claimed `max_attempts` times. Returns (requeued, failed).
+        """
+        now = datetime.utcnow()
+        stale = (
+            AnalysisJob.status == JobStatus.RUNNING,
+            func.coalesce(AnalysisJob.heartbeat_at, AnalysisJob.started_at) < now - timedelta(seconds=lease_seconds)
+        )
+        failed = db.execute(
+            update(AnalysisJob)
+            .where(*stale, AnalysisJob.attempts >= max_attempts)
+            .values(
+                status=JobStatus.FAILED,
+                error=f"Analysis job stopped responding after {max_attempts} attempt(s)",
+                finished_at=now
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        requeued = db.execute(
+            update(AnalysisJob)
+            .where(*stale, AnalysisJob.attempts < max_attempts)
+            .values(status=JobStatus.PENDING, progress=0, started_at=None, heartbeat_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return requeued, failed
+
+    @staticmethod
+    def finish_job(db: Session, job_id, attempt, result=None, error=None):
+        """
+        Stores the outcome of the claim `attempt`. Returns False, writing
+        nothing, when that claim no longer holds the job.
+        """
+        finished = db.execute(
+            update(AnalysisJob)
+            .where(*_held_by(job_id, attempt))
+            .values(
+                status=JobStatus.FAILED if error is not None else JobStatus.SUCCEEDED,
+                progress=100,
+                result=json.dumps(result) if result is not None else None,
+                error=error,
+                finished_at=datetime.utcnow()
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return finished == 1
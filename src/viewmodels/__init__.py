@@ -1,3 +1,4 @@
 from .auth_viewmodel import AuthViewModel
 from .variable_viewmodel import VariableViewModel
-from .cld_viewmodel import CLDViewModel 
\ No newline at end of file
+from .cld_viewmodel import CLDViewModel
+from .job_viewmodel import JobViewModel
\ No newline at end of file
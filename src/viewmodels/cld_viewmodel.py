@@ -1,7 +1,22 @@
+import os
+import time
 from datetime import datetime
-from ..models.repositories import CLDRepository, RelationshipRepository, VariableRepository
+from ..models.repositories import (
+    CLDRepository, RelationshipRepository, VariableRepository, AnalysisRepository, JobRepository
+)
 from ..models.domain_logic import CLDAnalyzer
-from ..models.entities import RelationshipType, Variable, CLD, Relationship
+from ..models.analysis_cache import analysis_cache
+from ..metrics import ANALYSIS_GRAPH_BUILD_SECONDS, ANALYSIS_PERSIST_SECONDS, ANALYSIS_RESULTS
+from ..models.entities import RelationshipType, LoopType, Variable, CLD, Relationship
+from ..models.graph import CompactGraph
+
+# Seconds PUT /cld may spend updating stored feedback loops before handing them to a job
+LOOP_MAINTENANCE_TIME_BUDGET = float(os.getenv("LOOP_MAINTENANCE_TIME_BUDGET", 1.0))
+# Time budget of the background re-analysis queued in that case
+LOOP_REANALYSIS_TIME_BUDGET = float(os.getenv("LOOP_REANALYSIS_TIME_BUDGET", 60.0))
+
+def _no_progress(phase):
+    pass
 
 class CLDViewModel:
     def __init__(self, db_session):
@@ -9,6 +24,8 @@ class CLDViewModel:
         self.cld_repo = CLDRepository()
         self.rel_repo = RelationshipRepository()
         self.var_repo = VariableRepository()
+        self.analysis_repo = AnalysisRepository()
+        self.job_repo = JobRepository()
         self.analyzer = CLDAnalyzer
     
     def create_cld(self, user_id, name, date_str, description, variable_ids, relationships_data):
@@ -36,37 +53,35 @@ class CLDViewModel:
                 return None, f"Invalid relationship type. Must be one of: {[t.name for t in RelationshipType]}"
         
         try:
-            # Create the CLD
-            cld = self.cld_repo.create_cld(
+            # Validate all variables with one query before writing anything
+            variables = self.var_repo.get_user_variables_by_ids(self.db_session, user_id, variable_ids)
+            for var_id in variable_ids:
+                if var_id not in variables:
+                    return None, f"Variable {var_id} not found or does not belong to user"
+            
+            # Create the CLD, its variables, relationships and graph snapshot in one transaction
+            # One relationship per edge, as an update of the same payload would store
+            triples = self.rel_repo.unique_edges([
+                (rel['source_id'], rel['target_id'], RelationshipType[rel['type'].upper()])
+                for rel in relationships_data
+            ])
+            unique_variable_ids = list(dict.fromkeys(variable_ids))
+            with ANALYSIS_GRAPH_BUILD_SECONDS.time():
+                graph = CompactGraph.from_triples(unique_variable_ids, triples)
+            cld = self.cld_repo.create_cld_with_contents(
                 self.db_session,
                 user_id=user_id,
                 name=name,
                 date=cld_date,
-                description=description
+                description=description,
+                variable_ids=unique_variable_ids,
+                relationships=triples,
+                graph_snapshot=graph.to_snapshot(len(unique_variable_ids))
             )
-            
-            # Add variables to CLD
-            for var_id in variable_ids:
-                variable = self.db_session.query(Variable).filter_by(
-                    id=var_id,
-                    user_id=user_id
-                ).first()
-                if not variable:
-                    self.db_session.rollback()
-                    return None, f"Variable {var_id} not found or does not belong to user"
-                cld.variables.append(variable)
-            
-            # Create relationships
-            for rel in relationships_data:
-                relationship = self.rel_repo.create_relationship(
-                    self.db_session,
-                    cld_id=cld.id,
-                    source_id=rel['source_id'],
-                    target_id=rel['target_id'],
-                    rel_type=RelationshipType[rel['type'].upper()]
-                )
+            self.db_session.commit()
             
             # Format CLD for response
+            cld = self.cld_repo.get_cld_aggregate_by_user(self.db_session, cld.id, user_id)
             cld_data = self._format_cld(cld)
             return cld_data, "CLD created successfully"
             
@@ -80,23 +95,32 @@ class CLDViewModel:
         if not clds:
             return [], "No CLDs found"
         
-        # Transform to presentation format
-        cld_list = [
-            {
-                'id': cld.id,
-                'name': cld.name,
-                'description': cld.description,
-                'date': cld.date.isoformat(),
-                'variable_count': len(cld.variables)
-            }
-            for cld in clds
-        ]
+        # Transform to presentation format; the counts are kept on the CLD row
+        cld_list = [self._format_cld_summary(cld) for cld in clds]
         
         return cld_list, "CLDs retrieved successfully"
     
+    def get_user_clds_page(self, user_id, limit, sort=None, prefix=None, cursor=None):
+        """Get one page of a user's CLDs, sorted and filtered by name prefix"""
+        sort = sort or 'name'
+        if sort.lstrip('-') not in ('name', 'date'):
+            return None, "Invalid sort. Must be one of: ['name', '-name', 'date', '-date']"
+        
+        try:
+            clds, next_cursor = self.cld_repo.get_user_clds_page(
+                self.db_session, user_id, limit, sort=sort, prefix=prefix, cursor=cursor
+            )
+        except ValueError as e:
+            return None, str(e)
+        
+        return {
+            'clds': [self._format_cld_summary(cld) for cld in clds],
+            'next_cursor': next_cursor
+        }, "CLDs retrieved successfully"
+    
     def get_cld(self, cld_id, user_id):
         """Get a specific CLD by ID"""
-        cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
+        cld = self.cld_repo.get_cld_aggregate_by_user(self.db_session, cld_id, user_id)
         if not cld:
             return None, "CLD not found or not owned by user"
         
@@ -143,9 +167,16 @@ class CLDViewModel:
                 print(f"ViewModel: Updating relationships: {relationships}")
             
             # Get the CLD first to verify it exists
-            cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
+            cld = self.cld_repo.get_cld_aggregate_by_user(self.db_session, cld_id, user_id)
             if not cld:
                 return None, "CLD not found or not owned by user"
+            
+            # Fingerprint of the stored loop analysis, with its bounds, before the edit
+            loop_bounds = {
+                'max_length': cld.feedback_loops_max_length,
+                'max_loops': cld.feedback_loops_max_loops
+            }
+            previous_fingerprint = self.analyzer.fingerprint(cld, 'feedback_loops', **loop_bounds)
                 
             # Update the CLD fields
             if name is not None:
@@ -157,24 +188,21 @@ class CLDViewModel:
             
             # Update variables if provided
             if variables is not None:
-                # Clear existing variables
-                cld.variables = []
-                # Add new variables
+                # Validate all variables with one query, then replace the set
+                found = self.var_repo.get_user_variables_by_ids(self.db_session, user_id, variables)
                 for var_id in variables:
-                    variable = self.db_session.query(Variable).filter_by(
-                        id=var_id,
-                        user_id=user_id
-                    ).first()
-                    if not variable:
+                    if var_id not in found:
                         self.db_session.rollback()
                         return None, f"Variable {var_id} not found or does not belong to user"
-                    cld.variables.append(variable)
+                cld.variables = [found[var_id] for var_id in dict.fromkeys(variables)]
+            
+            # Edges before the edit, used to maintain stored feedback loops incrementally
+            previous_edges = {(rel.source_id, rel.target_id) for rel in cld.relationships}
             
-            # Update relationships if provided
+            # Update relationships if provided, writing only the changed ones
+            relationship_changes = None
             if relationships is not None:
-                # Delete existing relationships
-                self.db_session.query(Relationship).filter_by(cld_id=cld_id).delete()
-                # Add new relationships
+                triples = []
                 for rel in relationships:
                     if rel['source_id'] == rel['target_id']:
                         self.db_session.rollback()
@@ -186,23 +214,49 @@ class CLDViewModel:
                     except KeyError:
                         self.db_session.rollback()
                         return None, f"Invalid relationship type. Must be one of: {[t.name for t in RelationshipType]}"
-                    
-                    relationship = Relationship(
-                        cld_id=cld_id,
-                        source_id=rel['source_id'],
-                        target_id=rel['target_id'],
-                        type=rel_type
-                    )
-                    self.db_session.add(relationship)
+                    triples.append((rel['source_id'], rel['target_id'], rel_type))
+                
+                added, updated, removed = self.rel_repo.sync_relationships(self.db_session, cld, triples)
+                relationship_changes = {
+                    'added': [self._format_relationship(rel) for rel in added],
+                    'updated': [self._format_relationship(rel) for rel in updated],
+                    'removed': [rel.id for rel in removed]
+                }
+                print(f"ViewModel: Relationships: {len(added)} added, {len(updated)} updated, {len(removed)} removed")
+            
+            relationships_changed = relationship_changes is not None and any(relationship_changes.values())
+            loops_maintained = True
+            if variables is not None or relationships_changed:
+                self.db_session.flush()
+                # Rewrite the graph snapshot in the transaction of the edit
+                graph = self.analyzer.build_graph(cld)
+                cld.graph_snapshot = graph.to_snapshot(len(cld.variables))
+                loops_maintained = self._maintain_feedback_loops(
+                    cld, previous_edges, previous_fingerprint, graph, loop_bounds
+                )
+                self.cld_repo.refresh_summary(
+                    self.db_session, cld,
+                    variables=variables is not None,
+                    relationships=relationships_changed
+                )
                 
             # Commit the changes directly
             self.db_session.commit()
             
-            # Refresh to ensure we have the latest data
-            self.db_session.refresh(cld)
+            # Stored loops that could not be brought up to date are recomputed in the background
+            reanalysis_job_id = None
+            if not loops_maintained:
+                reanalysis_job_id = self._queue_loop_reanalysis(cld_id, user_id, loop_bounds)
+            
+            # Reload the committed CLD with everything the response needs
+            cld = self.cld_repo.get_cld_aggregate_by_user(self.db_session, cld_id, user_id)
             
             # Get the updated CLD data in formatted form
             cld_data = self._format_cld(cld)
+            if relationship_changes is not None:
+                cld_data['relationship_changes'] = relationship_changes
+            if reanalysis_job_id is not None:
+                cld_data['reanalysis_job_id'] = reanalysis_job_id
             
             # Debug output to check the formatted data
             print(f"ViewModel: Updated CLD data: {cld_data}")
@@ -213,6 +267,65 @@ class CLDViewModel:
             print(f"Error in update_cld: {str(e)}")
             return None, f"Error updating CLD: {str(e)}"
     
+    def _maintain_feedback_loops(self, cld, previous_edges, previous_fingerprint, graph, loop_bounds):
+        """
+        Brings stored feedback loops up to date after an edit, within the
+        bounds of the analysis that stored them: only loops touched by the
+        change are deleted, re-typed or added, the others keep their IDs and
+        stay cached under the new fingerprint. CLDs never analyzed are left
+        for the next analysis.
+        Only a complete result for its bounds can be maintained exactly.
+        Loops cut short by a limit, stored without their order, or not
+        updated within LOOP_MAINTENANCE_TIME_BUDGET are left as they are
+        with their fingerprint cleared; returns False so the caller queues a
+        re-analysis.
+        """
+        stored_loops = self.analysis_repo.get_feedback_loops(self.db_session, cld.id)
+        if stored_loops == [] and cld.feedback_loops_fingerprint is None:
+            return True
+        
+        exact = (
+            stored_loops is not None
+            and cld.feedback_loops_fingerprint == previous_fingerprint
+            and not cld.feedback_loops_truncated
+        )
+        if exact:
+            deleted, retyped, added, truncated = self.analyzer.update_feedback_loops(
+                cld, previous_edges, stored_loops,
+                max_length=loop_bounds['max_length'],
+                graph=graph,
+                time_budget=LOOP_MAINTENANCE_TIME_BUDGET
+            )
+            max_loops = loop_bounds['max_loops']
+            # Past max_loops the analysis would keep a subset that depends on search order
+            exact = not truncated and (
+                max_loops is None or len(stored_loops) - len(deleted) + len(added) <= max_loops
+            )
+        if not exact:
+            cld.feedback_loops_fingerprint = None
+            print(f"ViewModel: Feedback loops of CLD {cld.id} left for re-analysis")
+            return False
+        
+        self.analysis_repo.apply_feedback_loop_changes(self.db_session, cld.id, deleted, retyped, added)
+        self.cld_repo.refresh_summary(self.db_session, cld, feedback_loops=True)
+        cld.feedback_loops_fingerprint = self.analyzer.graph_fingerprint(
+            graph, len(cld.variables), 'feedback_loops', **loop_bounds
+        )
+        print(f"ViewModel: Feedback loops updated: {len(deleted)} removed, {len(retyped)} re-typed, {len(added)} added")
+        return True
+    
+    def _queue_loop_reanalysis(self, cld_id, user_id, loop_bounds):
+        """
+        Queues a feedback loop analysis with the bounds of the stored loops,
+        reusing one already pending. Returns the job id; the caller hands it
+        to the job runner.
+        """
+        params = dict(loop_bounds, time_budget=LOOP_REANALYSIS_TIME_BUDGET)
+        job = self.job_repo.get_pending_job(self.db_session, cld_id, 'feedback_loops', params)
+        if job is None:
+            job = self.job_repo.create_job(self.db_session, user_id, cld_id, 'feedback_loops', params)
+        return job.id
+    
     def delete_cld(self, cld_id, user_id):
         """Delete a CLD"""
         try:
@@ -224,80 +337,389 @@ class CLDViewModel:
         except Exception as e:
             return False, f"Error deleting CLD: {str(e)}"
     
-    def identify_feedback_loops(self, cld_id, user_id):
-        """Identify feedback loops in a CLD"""
+    def identify_feedback_loops(self, cld_id, user_id, max_length=None, max_loops=None, time_budget=None,
+                                progress=None):
+        """
+        Identify feedback loops in a CLD, optionally bounded by length, count
+        and time. `progress` is called with the name of each phase as it ends.
+        """
+        progress = progress or _no_progress
         cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
         if not cld:
             return None, "CLD not found or not owned by user"
+        progress('load')
             
         try:
-            # First, clear existing feedback loops
-            for loop in list(cld.feedback_loops):
-                self.db_session.delete(loop)
-            cld.feedback_loops = []
-            self.db_session.flush()
-            
-            # Use domain logic to identify feedback loops
-            feedback_loops = self.analyzer.identify_feedback_loops(cld, self.db_session)
-            
-            # Commit the changes
+            graph, variable_count = self._load_graph(cld)
+            progress('graph')
+            loops_data, truncated = self._run_feedback_loops(
+                cld, graph, variable_count, max_length, max_loops, time_budget
+            )
+            progress('feedback_loops')
             self.db_session.commit()
-            
-            # Format feedback loops for response
-            loops_data = [
-                {
-                    'id': loop.id,
-                    'type': loop.type.name,
-                    'variables': [var.id for var in loop.variables]
-                }
-                for loop in feedback_loops
-            ]
+            progress('commit')
             
             # Return empty array if no feedback loops found
-            return loops_data, "Feedback loops identified successfully"
+            return {
+                'feedback_loops': loops_data,
+                'truncated': truncated
+            }, "Feedback loops identified successfully"
         except Exception as e:
             self.db_session.rollback()
             return None, f"Error identifying feedback loops: {str(e)}"
     
-    def identify_archetypes(self, cld_id, user_id):
-        """Identify system archetypes in a CLD"""
+    def _load_graph(self, cld):
+        """
+        (graph, variable_count) of the CLD decoded from its stored snapshot,
+        fetched as a single column without loading variables or
+        relationships. A CLD without a readable snapshot is built from its
+        variables and relationships once, and the snapshot is written for
+        the caller to commit.
+        """
+        snapshot = self.cld_repo.get_graph_snapshot(self.db_session, cld.id)
+        if snapshot is not None:
+            try:
+                return self.analyzer.load_graph(snapshot)
+            except ValueError as e:
+                print(f"ViewModel: Rebuilding graph snapshot of CLD {cld.id}: {str(e)}")
+        
+        graph = self.analyzer.build_graph(cld)
+        variable_count = len(cld.variables)
+        cld.graph_snapshot = graph.to_snapshot(variable_count)
+        return graph, variable_count
+    
+    def _run_feedback_loops(self, cld, graph, variable_count, max_length, max_loops, time_budget):
+        """
+        Feedback loops of the CLD graph as (formatted loops, truncated).
+        Stored or cached results are reused when the fingerprint matches;
+        otherwise the new loops replace the stored ones. The caller commits.
+        """
+        # A run that is not cut short by time_budget gives the same loops without it
+        fingerprint = self.analyzer.graph_fingerprint(
+            graph, variable_count, 'feedback_loops', max_length=max_length, max_loops=max_loops
+        )
+        
+        # Nothing changed since the last analysis: return the stored loops
+        if cld.feedback_loops_fingerprint == fingerprint:
+            stored_loops = self.analysis_repo.get_feedback_loops(self.db_session, cld.id)
+            if stored_loops is not None:
+                ANALYSIS_RESULTS.inc(analysis='feedback_loops', source='stored')
+                return [
+                    {'id': loop_id, 'type': loop_type.name, 'variables': variable_ids}
+                    for loop_id, loop_type, variable_ids in stored_loops
+                ], bool(cld.feedback_loops_truncated)
+        
+        cached = analysis_cache.get(fingerprint)
+        ANALYSIS_RESULTS.inc(analysis='feedback_loops', source='cache' if cached is not None else 'computed')
+        if cached is not None:
+            feedback_loops, truncated = cached
+        else:
+            # Use domain logic to identify feedback loops
+            feedback_loops, truncated = self.analyzer.find_feedback_loops(
+                graph,
+                variable_count=variable_count,
+                max_length=max_length,
+                max_loops=max_loops,
+                time_budget=time_budget
+            )
+        
+        # Results cut short by the time budget depend on machine load; don't reuse them
+        reusable = not (truncated and time_budget is not None)
+        if reusable and cached is None:
+            analysis_cache.put(fingerprint, feedback_loops, truncated)
+        
+        # Replace the previous results with a set-based delete and bulk insert
+        with ANALYSIS_PERSIST_SECONDS.time(analysis='feedback_loops'):
+            loops_data = self.analysis_repo.replace_feedback_loops(self.db_session, cld.id, feedback_loops)
+        cld.feedback_loops_fingerprint = fingerprint if reusable else None
+        cld.feedback_loops_truncated = truncated
+        cld.feedback_loops_max_length = max_length
+        cld.feedback_loops_max_loops = max_loops
+        cld.reinforcing_loop_count = sum(1 for loop in loops_data if loop['type'] == LoopType.REINFORCING.name)
+        cld.balancing_loop_count = len(loops_data) - cld.reinforcing_loop_count
+        cld.last_analyzed_at = datetime.utcnow()
+        return loops_data, truncated
+    
+    def get_feedback_loop_census(self, cld_id, user_id, max_length, time_budget=None):
+        """Count feedback loops by length and type without persisting them"""
+        cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
+        if not cld:
+            return None, "CLD not found or not owned by user"
+        
+        graph, _ = self._load_graph(cld)
+        census, truncated = self.analyzer.loop_census(cld, max_length, time_budget=time_budget, graph=graph)
+        
+        by_length = [
+            {
+                'length': length,
+                'reinforcing': census[length][LoopType.REINFORCING],
+                'balancing': census[length][LoopType.BALANCING]
+            }
+            for length in sorted(census)
+        ]
+        
+        return {
+            'max_length': max_length,
+            'by_length': by_length,
+            'reinforcing': sum(row['reinforcing'] for row in by_length),
+            'balancing': sum(row['balancing'] for row in by_length),
+            'truncated': truncated
+        }, "Feedback loop census computed successfully"
+    
+    def get_motif_census(self, cld_id, user_id):
+        """Count signed motifs in a CLD and list the archetypes they allow"""
+        cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
+        if not cld:
+            return None, "CLD not found or not owned by user"
+        
+        graph, _ = self._load_graph(cld)
+        census, candidates = self.analyzer.motif_census(cld, graph=graph)
+        
+        return {
+            'motifs': census,
+            'candidate_archetypes': [archetype_type.name for archetype_type in candidates]
+        }, "Motif census computed successfully"
+    
+    def identify_archetypes(self, cld_id, user_id, max_per_type=None, max_total=None, limit=None,
+                            progress=None):
+        """
+        Identify system archetypes in a CLD, returning the first `limit` of
+        them. `progress` is called with the name of each phase as it ends.
+        """
+        progress = progress or _no_progress
         cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
         if not cld:
             return None, "CLD not found or not owned by user"
+        progress('load')
             
         try:
-            # First, clear existing archetypes
-            for arch in list(cld.archetypes):
-                self.db_session.delete(arch)
-            cld.archetypes = []
-            self.db_session.flush()
-            
-            # Use domain logic to identify archetypes
-            archetypes = self.analyzer.identify_archetypes(cld, self.db_session)
-            
-            # Commit the changes
+            graph, variable_count = self._load_graph(cld)
+            progress('graph')
+            archetypes_data, truncated = self._run_archetypes(cld, graph, variable_count, max_per_type, max_total)
+            progress('archetypes')
             self.db_session.commit()
+            progress('commit')
             
-            # Format archetypes for response
-            archetypes_data = [
-                {
-                    'id': arch.id,
-                    'type': arch.type.name,
-                    'variables': [var.id for var in arch.variables]
-                }
-                for arch in archetypes
-            ]
+            # First page in the same id order GET uses, so next_cursor continues there
+            archetypes_data.sort(key=lambda archetype: archetype['id'])
+            next_cursor = None
+            if limit is not None and len(archetypes_data) > limit:
+                archetypes_data = archetypes_data[:limit]
+                next_cursor = archetypes_data[-1]['id']
             
             # Return empty array if no archetypes found
-            return archetypes_data, "Archetypes identified successfully"
+            return {
+                'archetypes': archetypes_data,
+                'truncated': truncated,
+                'next_cursor': next_cursor
+            }, "Archetypes identified successfully"
         except Exception as e:
             self.db_session.rollback()
             return None, f"Error identifying archetypes: {str(e)}"
     
+    def _run_archetypes(self, cld, graph, variable_count, max_per_type, max_total):
+        """
+        Archetypes of the CLD graph as (formatted archetypes, truncated),
+        reusing stored or cached results like _run_feedback_loops. The
+        caller commits.
+        """
+        fingerprint = self.analyzer.graph_fingerprint(
+            graph, variable_count, 'archetypes', max_per_type=max_per_type, max_total=max_total
+        )
+        
+        # Nothing changed since the last analysis: return the stored archetypes
+        if cld.archetypes_fingerprint == fingerprint:
+            ANALYSIS_RESULTS.inc(analysis='archetypes', source='stored')
+            archetypes_data, _ = self.analysis_repo.get_archetypes_page(self.db_session, cld.id)
+            return archetypes_data, bool(cld.archetypes_truncated)
+        
+        cached = analysis_cache.get(fingerprint)
+        ANALYSIS_RESULTS.inc(analysis='archetypes', source='cache' if cached is not None else 'computed')
+        if cached is not None:
+            archetypes, truncated = cached
+        else:
+            # Use domain logic to identify archetypes, keeping at most
+            # max_per_type matches per archetype and max_total overall
+            archetypes, truncated = self.analyzer.find_archetypes(
+                graph,
+                variable_count=variable_count,
+                max_per_type=max_per_type,
+                max_total=max_total
+            )
+            analysis_cache.put(fingerprint, archetypes, truncated)
+        
+        # Replace the previous results with a set-based delete and bulk insert
+        with ANALYSIS_PERSIST_SECONDS.time(analysis='archetypes'):
+            archetypes_data = self.analysis_repo.replace_archetypes(self.db_session, cld.id, archetypes)
+        cld.archetypes_fingerprint = fingerprint
+        cld.archetypes_truncated = truncated
+        cld.archetype_count = len(archetypes_data)
+        cld.last_analyzed_at = datetime.utcnow()
+        return archetypes_data, truncated
+    
+    def analyze_cld(self, cld_id, user_id, max_length=None, max_loops=None, time_budget=None,
+                    max_per_type=None, max_total=None, progress=None):
+        """
+        Identify feedback loops and archetypes in one pass: the CLD row and
+        its graph snapshot are loaded once, both analyses share the graph and
+        the results are committed together. Reports the duration of each
+        phase in milliseconds, and calls `progress` with the name of each
+        phase as it ends.
+        """
+        progress = progress or _no_progress
+        timings = {}
+        started = time.perf_counter()
+        
+        def phase_done(name):
+            nonlocal started
+            now = time.perf_counter()
+            timings[name] = round((now - started) * 1000, 3)
+            started = now
+            progress(name)
+        
+        cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
+        if not cld:
+            return None, "CLD not found or not owned by user"
+        phase_done('load')
+        
+        try:
+            graph, variable_count = self._load_graph(cld)
+            phase_done('graph')
+            
+            loops_data, loops_truncated = self._run_feedback_loops(
+                cld, graph, variable_count, max_length, max_loops, time_budget
+            )
+            phase_done('feedback_loops')
+            
+            archetypes_data, archetypes_truncated = self._run_archetypes(
+                cld, graph, variable_count, max_per_type, max_total
+            )
+            phase_done('archetypes')
+            
+            self.db_session.commit()
+            phase_done('commit')
+            
+            return {
+                'feedback_loops': loops_data,
+                'feedback_loops_truncated': loops_truncated,
+                'archetypes': archetypes_data,
+                'archetypes_truncated': archetypes_truncated,
+                'timings': timings
+            }, "CLD analyzed successfully"
+        except Exception as e:
+            self.db_session.rollback()
+            return None, f"Error analyzing CLD: {str(e)}"
+    
+    def get_archetypes(self, cld_id, user_id, limit=None, cursor=None):
+        """Get one page of the stored archetypes of a CLD"""
+        cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
+        if not cld:
+            return None, "CLD not found or not owned by user"
+        
+        archetypes, next_cursor = self.analysis_repo.get_archetypes_page(
+            self.db_session, cld.id, limit=limit, cursor=cursor
+        )
+        return {
+            'archetypes': archetypes,
+            'next_cursor': next_cursor
+        }, "Archetypes retrieved successfully"
+    
+    def preview_analysis(self, variable_ids, relationships_data, max_length=None, max_loops=None,
+                         time_budget=None, max_per_type=None, max_total=None):
+        """
+        Analyze an unsaved diagram: loops and archetypes of the given variables
+        and relationships, computed in memory without reading or writing the
+        database. Results share the analysis cache with persisted analyses.
+        """
+        if not isinstance(variable_ids, list) or not all(isinstance(var_id, str) for var_id in variable_ids):
+            return None, "Variables must be a list of variable ids"
+        if not isinstance(relationships_data, list) or not all(isinstance(rel, dict) for rel in relationships_data):
+            return None, "Relationships must be a list of objects"
+        
+        variable_ids = list(dict.fromkeys(variable_ids))
+        known_ids = set(variable_ids)
+        
+        triples = []
+        for index, rel in enumerate(relationships_data):
+            if not all(k in rel for k in ['source_id', 'target_id', 'type']):
+                return None, "Each relationship must include source_id, target_id, and type"
+            if not isinstance(rel['source_id'], str) or not isinstance(rel['target_id'], str):
+                return None, f"Relationship {index}: source_id and target_id must be variable ids (strings)"
+            if not isinstance(rel['type'], str):
+                return None, f"Relationship {index}: type must be a string, one of {[t.name for t in RelationshipType]}"
+            if rel['source_id'] == rel['target_id']:
+                return None, "Cannot create relationship with the same source and target variable"
+            if rel['source_id'] not in known_ids or rel['target_id'] not in known_ids:
+                return None, "Relationship source and target must be among the variables"
+            try:
+                rel_type = RelationshipType[rel['type'].upper()]
+            except KeyError:
+                return None, f"Invalid relationship type. Must be one of: {[t.name for t in RelationshipType]}"
+            triples.append((rel['source_id'], rel['target_id'], rel_type))
+        
+        with ANALYSIS_GRAPH_BUILD_SECONDS.time():
+            graph = CompactGraph.from_triples(variable_ids, triples)
+        
+        loops_fingerprint = self.analyzer.diagram_fingerprint(
+            variable_ids, triples, 'feedback_loops', max_length=max_length, max_loops=max_loops
+        )
+        cached = analysis_cache.get(loops_fingerprint)
+        if cached is not None:
+            feedback_loops, loops_truncated = cached
+        else:
+            feedback_loops, loops_truncated = self.analyzer.find_feedback_loops(
+                graph,
+                max_length=max_length,
+                max_loops=max_loops,
+                time_budget=time_budget
+            )
+            if not (loops_truncated and time_budget is not None):
+                analysis_cache.put(loops_fingerprint, feedback_loops, loops_truncated)
+        
+        archetypes_fingerprint = self.analyzer.diagram_fingerprint(
+            variable_ids, triples, 'archetypes', max_per_type=max_per_type, max_total=max_total
+        )
+        cached = analysis_cache.get(archetypes_fingerprint)
+        if cached is not None:
+            archetypes, archetypes_truncated = cached
+        else:
+            archetypes, archetypes_truncated = self.analyzer.find_archetypes(
+                graph,
+                max_per_type=max_per_type,
+                max_total=max_total
+            )
+            analysis_cache.put(archetypes_fingerprint, archetypes, archetypes_truncated)
+        
+        return {
+            'feedback_loops': [
+                {'type': loop_type.name, 'variables': loop_variables}
+                for loop_type, loop_variables in feedback_loops
+            ],
+            'feedback_loops_truncated': loops_truncated,
+            'archetypes': [
+                {'type': archetype_type.name, 'variables': list(dict.fromkeys(archetype_variables))}
+                for archetype_type, archetype_variables in archetypes
+            ],
+            'archetypes_truncated': archetypes_truncated
+        }, "Analysis preview computed successfully"
+    
+    def _format_cld_summary(self, cld):
+        """Format a CLD for the listing, without its contents"""
+        return {
+            'id': cld.id,
+            'name': cld.name,
+            'description': cld.description,
+            'date': cld.date.isoformat(),
+            'variable_count': cld.variable_count or 0,
+            'relationship_count': cld.relationship_count or 0,
+            'reinforcing_loop_count': cld.reinforcing_loop_count or 0,
+            'balancing_loop_count': cld.balancing_loop_count or 0,
+            'archetype_count': cld.archetype_count or 0,
+            'last_analyzed_at': cld.last_analyzed_at.isoformat() if cld.last_analyzed_at else None
+        }
+    
     def _format_cld(self, cld):
         """Format a CLD entity for response"""
-        relationships = self.rel_repo.get_relationships_by_cld(self.db_session, cld.id)
-        
         return {
             'id': cld.id,
             'name': cld.name,
@@ -311,15 +733,7 @@ class CLDViewModel:
                 } 
                 for var in cld.variables
             ],
-            'relationships': [
-                {
-                    'id': rel.id,
-                    'source_id': rel.source_id,
-                    'target_id': rel.target_id,
-                    'type': rel.type.name
-                } 
-                for rel in relationships
-            ],
+            'relationships': [self._format_relationship(rel) for rel in cld.relationships],
             'feedback_loops': [
                 {
                     'id': loop.id,
@@ -336,4 +750,13 @@ class CLDViewModel:
                 } 
                 for arch in cld.archetypes
             ]
-        } 
\ No newline at end of file
+        } 
+    
+    def _format_relationship(self, rel):
+        """Format a relationship for response"""
+        return {
+            'id': rel.id,
+            'source_id': rel.source_id,
+            'target_id': rel.target_id,
+            'type': rel.type.name
+        }
@@ -0,0 +1,138 @@
+import json
+import threading
+from sqlalchemy.orm import Session
+from ..models.repositories import CLDRepository, JobRepository
+from .cld_viewmodel import CLDViewModel
+
+# Analysis job types and the CLDViewModel method each one runs
+JOB_TYPES = {
+    'feedback_loops': 'identify_feedback_loops',
+    'archetypes': 'identify_archetypes',
+    'analysis': 'analyze_cld',
+}
+
+# Phases each job type reports as they end, in order; progress is the share done
+JOB_PHASES = {
+    'feedback_loops': ('load', 'graph', 'feedback_loops', 'commit'),
+    'archetypes': ('load', 'graph', 'archetypes', 'commit'),
+    'analysis': ('load', 'graph', 'feedback_loops', 'archetypes', 'commit'),
+}
+
+class JobViewModel:
+    def __init__(self, db_session):
+        self.db_session = db_session
+        self.cld_repo = CLDRepository()
+        self.job_repo = JobRepository()
+
+    def create_job(self, cld_id, user_id, job_type, params):
+        """Queue an analysis of a CLD; `params` are the keyword arguments of the analysis"""
+        if job_type not in JOB_TYPES:
+            return None, f"Invalid job type. Must be one of: {list(JOB_TYPES)}"
+
+        cld = self.cld_repo.get_cld_by_user(self.db_session, cld_id, user_id)
+        if not cld:
+            return None, "CLD not found or not owned by user"
+
+        try:
+            job = self.job_repo.create_job(self.db_session, user_id, cld.id, job_type, params)
+            return self._format_job(job), "Analysis job queued"
+        except Exception as e:
+            self.db_session.rollback()
+            return None, f"Error queuing analysis job: {str(e)}"
+
+    def get_job(self, job_id, user_id):
+        """Get the status, progress and result of an analysis job"""
+        job = self.job_repo.get_job_by_user(self.db_session, job_id, user_id)
+        if not job:
+            return None, "Job not found or not owned by user"
+
+        return self._format_job(job), "Job retrieved successfully"
+
+    def run_job(self, job_id, heartbeat_interval=30):
+        """
+        Run a queued job to completion, renewing its lease every
+        `heartbeat_interval` seconds while it runs. Returns False when the
+        job was not PENDING (already claimed by another worker, or finished).
+        The outcome is discarded when the job was recovered as stale and
+        claimed again in the meantime.
+        """
+        attempt = self.job_repo.claim_job(self.db_session, job_id)
+        if attempt is None:
+            return False
+
+        job = self.job_repo.get_job(self.db_session, job_id)
+        stop_heartbeat = self._start_heartbeat(job_id, attempt, heartbeat_interval)
+        try:
+            analysis = getattr(CLDViewModel(self.db_session), JOB_TYPES[job.type])
+            result, message = analysis(
+                job.cld_id, job.user_id, progress=self._progress_reporter(job_id, attempt, job.type),
+                **json.loads(job.params or '{}')
+            )
+        except Exception as e:
+            self.db_session.rollback()
+            result, message = None, f"Error running analysis job: {str(e)}"
+        finally:
+            stop_heartbeat.set()
+
+        if result is None:
+            finished = self.job_repo.finish_job(self.db_session, job_id, attempt, error=message)
+        else:
+            finished = self.job_repo.finish_job(self.db_session, job_id, attempt, result={'message': message, **result})
+        if not finished:
+            print(f"Discarded the outcome of analysis job {job_id} attempt {attempt}: the job was taken over")
+        return True
+
+    def _start_heartbeat(self, job_id, attempt, interval):
+        """
+        Renews the lease of the claim `attempt` every `interval` seconds from
+        a daemon thread, in a session of its own, until the returned event is
+        set or the claim is lost.
+        """
+        stop = threading.Event()
+        bind = self.db_session.get_bind()
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    with Session(bind) as session:
+                        if not self.job_repo.set_progress(session, job_id, attempt):
+                            return
+                except Exception as e:
+                    print(f"Error renewing the lease of analysis job {job_id}: {str(e)}")
+
+        threading.Thread(target=beat, name=f'analysis-job-heartbeat-{job_id}', daemon=True).start()
+        return stop
+
+    def _progress_reporter(self, job_id, attempt, job_type):
+        """
+        Callable recording the progress of a job as its analysis ends each
+        phase. It writes in a session of its own, so pollers see the progress
+        while the analysis results are still uncommitted.
+        """
+        phases = JOB_PHASES[job_type]
+        bind = self.db_session.get_bind()
+
+        def report(phase):
+            # 'commit' ends at 99: the job reaches 100 when it is finished
+            progress = 99 * (phases.index(phase) + 1) // len(phases)
+            with Session(bind) as session:
+                self.job_repo.set_progress(session, job_id, attempt, progress)
+
+        return report
+
+    def _format_job(self, job):
+        """Format an analysis job for response"""
+        return {
+            'id': job.id,
+            'cld_id': job.cld_id,
+            'type': job.type,
+            'status': job.status.name,
+            'progress': job.progress,
+            'attempts': job.attempts,
+            'params': json.loads(job.params or '{}'),
+            'result': json.loads(job.result) if job.result else None,
+            'error': job.error,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None
+        }
@@ -1,5 +1,22 @@
+from sqlalchemy.exc import IntegrityError
 from ..models.repositories import VariableRepository
 
+# Unique index that keeps a user's variable names distinct
+NAME_INDEX = 'uq_variables_user_id_name'
+# Postgres SQLSTATE of a foreign key violation (the variable's user is gone)
+FOREIGN_KEY_VIOLATION = '23503'
+
+NAME_TAKEN = "Variable with this name already exists"
+USER_NOT_FOUND = "User not found"
+
+def _is_name_conflict(error):
+    """Whether an IntegrityError was raised by the unique (user_id, name) index"""
+    diag = getattr(error.orig, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == NAME_INDEX
+
+def _is_foreign_key_violation(error):
+    return getattr(error.orig, 'pgcode', None) == FOREIGN_KEY_VIOLATION
+
 class VariableViewModel:
     def __init__(self, db_session):
         self.db_session = db_session
@@ -7,19 +24,68 @@ class VariableViewModel:
     
     def create_variable(self, user_id, name, description):
         """Create a new variable for a user"""
-        # Check if variable with same name already exists for this user
-        existing_variables = self.variable_repo.get_user_variables(self.db_session, user_id)
-        for var in existing_variables:
-            if var.name == name:
-                return None, "Variable with this name already exists"
-        
-        # Create new variable
+        # Name uniqueness is enforced by the unique (user_id, name) index
         try:
             variable = self.variable_repo.create_variable(self.db_session, user_id, name, description)
             return variable, "Variable created successfully"
+        except IntegrityError as e:
+            self.db_session.rollback()
+            if _is_name_conflict(e):
+                return None, NAME_TAKEN
+            if _is_foreign_key_violation(e):
+                return None, USER_NOT_FOUND
+            return None, f"Error creating variable: {str(e)}"
         except Exception as e:
+            self.db_session.rollback()
             return None, f"Error creating variable: {str(e)}"
     
+    def create_variables(self, user_id, items):
+        """
+        Create many variables at once with one INSERT. Returns one result per
+        item, in order: created, exists (the user already has that name),
+        duplicate (the name appears earlier in the batch) or invalid.
+        """
+        results = [None] * len(items)
+        pending = {}  # name -> (item index, description)
+        for index, item in enumerate(items):
+            name = item.get('name') if isinstance(item, dict) else None
+            if not isinstance(name, str) or not name.strip():
+                results[index] = {'index': index, 'status': 'invalid', 'message': "Each variable needs a non-empty name"}
+            elif not isinstance(item.get('description', ''), str):
+                results[index] = {'index': index, 'name': name, 'status': 'invalid', 'message': "Description must be a string"}
+            elif name in pending:
+                results[index] = {
+                    'index': index, 'name': name, 'status': 'duplicate',
+                    'message': f"Same name as item {pending[name][0]}"
+                }
+            else:
+                pending[name] = (index, item.get('description', ''))
+        
+        try:
+            created = self.variable_repo.create_variables(
+                self.db_session, user_id, [(name, description) for name, (_, description) in pending.items()]
+            )
+            existing = self.variable_repo.get_user_variable_ids_by_names(
+                self.db_session, user_id, [name for name in pending if name not in created]
+            )
+            self.db_session.commit()
+        except Exception as e:
+            self.db_session.rollback()
+            return None, f"Error creating variables: {str(e)}"
+        
+        for name, (index, _) in pending.items():
+            if name in created:
+                results[index] = {'index': index, 'name': name, 'id': created[name], 'status': 'created'}
+            else:
+                results[index] = {
+                    'index': index, 'name': name, 'id': existing.get(name), 'status': 'exists',
+                    'message': NAME_TAKEN
+                }
+        return {
+            'results': results,
+            'created': len(created)
+        }, f"{len(created)} of {len(items)} variables created"
+    
     def get_user_variables(self, user_id):
         """Get all variables for a user"""
         variables = self.variable_repo.get_user_variables(self.db_session, user_id)
@@ -38,6 +104,31 @@ class VariableViewModel:
         
         return variable_list, "Variables retrieved successfully"
     
+    def get_user_variables_page(self, user_id, limit, sort=None, prefix=None, cursor=None):
+        """Get one page of a user's variables, sorted and filtered by name prefix"""
+        sort = sort or 'name'
+        if sort not in ('name', '-name'):
+            return None, "Invalid sort. Must be one of: ['name', '-name']"
+        
+        try:
+            variables, next_cursor = self.variable_repo.get_user_variables_page(
+                self.db_session, user_id, limit, sort=sort, prefix=prefix, cursor=cursor
+            )
+        except ValueError as e:
+            return None, str(e)
+        
+        return {
+            'variables': [
+                {
+                    'id': var.id,
+                    'name': var.name,
+                    'description': var.description
+                }
+                for var in variables
+            ],
+            'next_cursor': next_cursor
+        }, "Variables retrieved successfully"
+    
     def update_variable(self, variable_id, user_id, name=None, description=None):
         """Update an existing variable"""
         try:
@@ -53,9 +144,117 @@ class VariableViewModel:
                 return None, "Variable not found or not owned by user"
                 
             return variable, "Variable updated successfully"
+        except IntegrityError as e:
+            self.db_session.rollback()
+            if _is_name_conflict(e):
+                return None, NAME_TAKEN
+            return None, f"Error updating variable: {str(e)}"
         except Exception as e:
+            self.db_session.rollback()
             return None, f"Error updating variable: {str(e)}"
     
+    def update_variables(self, user_id, items):
+        """
+        Update many variables at once with one executemany UPDATE. Each item
+        has an id and the name and/or description to set. Returns one result
+        per item, in order: updated, not_found, conflict (another variable has
+        the name, or an earlier item takes it), duplicate (the id appears
+        earlier in the batch) or invalid. When another request takes one of
+        the names between the check and the UPDATE, nothing is updated and
+        the result is {'conflicts': names now held by other variables}.
+        """
+        results = [None] * len(items)
+        pending = {}  # variable id -> (item index, columns to set)
+        for index, item in enumerate(items):
+            variable_id = item.get('id') if isinstance(item, dict) else None
+            changes = {
+                key: item[key] for key in ('name', 'description')
+                if variable_id and item.get(key) is not None
+            }
+            if not isinstance(variable_id, str) or not variable_id:
+                results[index] = {
+                    'index': index, 'status': 'invalid',
+                    'message': "Each item needs an id and a name or description"
+                }
+            elif not changes:
+                results[index] = {
+                    'index': index, 'id': variable_id, 'status': 'invalid',
+                    'message': "Each item needs an id and a name or description"
+                }
+            elif not all(isinstance(value, str) for value in changes.values()):
+                results[index] = {
+                    'index': index, 'id': variable_id, 'status': 'invalid',
+                    'message': "Name and description must be strings"
+                }
+            elif 'name' in changes and not changes['name'].strip():
+                results[index] = {'index': index, 'id': variable_id, 'status': 'invalid', 'message': "Name cannot be empty"}
+            elif variable_id in pending:
+                results[index] = {
+                    'index': index, 'id': variable_id, 'status': 'duplicate',
+                    'message': f"Same id as item {pending[variable_id][0]}"
+                }
+            else:
+                pending[variable_id] = (index, changes)
+        
+        try:
+            owned = self.variable_repo.get_user_variables_by_ids(self.db_session, user_id, list(pending))
+            name_holders = self.variable_repo.get_user_variable_ids_by_names(
+                self.db_session, user_id, [changes['name'] for _, changes in pending.values() if 'name' in changes]
+            )
+            
+            rows = []
+            claimed = set()
+            for variable_id, (index, changes) in pending.items():
+                variable = owned.get(variable_id)
+                name = changes.get('name')
+                if variable is None:
+                    results[index] = {
+                        'index': index, 'id': variable_id, 'status': 'not_found',
+                        'message': "Variable not found or not owned by user"
+                    }
+                elif name is not None and (name_holders.get(name, variable_id) != variable_id or name in claimed):
+                    results[index] = {
+                        'index': index, 'id': variable_id, 'status': 'conflict',
+                        'message': NAME_TAKEN
+                    }
+                else:
+                    if name is not None:
+                        claimed.add(name)
+                    rows.append({'id': variable_id, **changes})
+                    results[index] = {
+                        'index': index, 'id': variable_id, 'status': 'updated',
+                        'variable': {
+                            'id': variable_id,
+                            'name': changes.get('name', variable.name),
+                            'description': changes.get('description', variable.description)
+                        }
+                    }
+            
+            self.variable_repo.update_variables(self.db_session, rows)
+            self.db_session.commit()
+        except IntegrityError as e:
+            self.db_session.rollback()
+            if not _is_name_conflict(e):
+                return None, f"Error updating variables: {str(e)}"
+            # Another request took one of the names since it was checked
+            return {
+                'conflicts': self._taken_names(user_id, rows)
+            }, "Variable names changed while updating; retry the request"
+        except Exception as e:
+            self.db_session.rollback()
+            return None, f"Error updating variables: {str(e)}"
+        
+        return {
+            'results': results,
+            'updated': len(rows)
+        }, f"{len(rows)} of {len(items)} variables updated"
+    
+    def _taken_names(self, user_id, rows):
+        """Names the update `rows` would set that other variables of the user now hold"""
+        renames = {row['name']: row['id'] for row in rows if 'name' in row}
+        holders = self.variable_repo.get_user_variable_ids_by_names(self.db_session, user_id, list(renames))
+        return sorted(name for name, holder in holders.items() if holder != renames[name])
+    
     def delete_variable(self, variable_id, user_id):
         """Delete a variable"""
         try:
@@ -65,4 +264,54 @@ class VariableViewModel:
                 
             return True, "Variable deleted successfully"
         except Exception as e:
-            return False, f"Error deleting variable: {str(e)}" 
\ No newline at end of file
+            return False, f"Error deleting variable: {str(e)}"
+    
+    def delete_variables(self, user_id, variable_ids):
+        """
+        Delete many variables at once with one DELETE. Returns one result per
+        id, in order: deleted, not_found, in_use (a CLD still references it)
+        or duplicate. When a CLD starts using one of them between the check
+        and the DELETE, nothing is deleted and the result is
+        {'conflicts': ids now in use}.
+        """
+        try:
+            owned = self.variable_repo.get_user_variables_by_ids(self.db_session, user_id, variable_ids)
+            in_use = self.variable_repo.get_variable_ids_in_use(self.db_session, list(owned))
+            
+            results = []
+            deleted = []
+            seen = set()
+            for index, variable_id in enumerate(variable_ids):
+                if variable_id in seen:
+                    status, message = 'duplicate', "Same id as an earlier item"
+                elif variable_id not in owned:
+                    status, message = 'not_found', "Variable not found or not owned by user"
+                elif variable_id in in_use:
+                    status, message = 'in_use', "Variable is used by a CLD"
+                else:
+                    status, message = 'deleted', None
+                    deleted.append(variable_id)
+                seen.add(variable_id)
+                result = {'index': index, 'id': variable_id, 'status': status}
+                if message:
+                    result['message'] = message
+                results.append(result)
+            
+            self.variable_repo.delete_variables(self.db_session, user_id, deleted)
+            self.db_session.commit()
+        except IntegrityError as e:
+            self.db_session.rollback()
+            if not _is_foreign_key_violation(e):
+                return None, f"Error deleting variables: {str(e)}"
+            # A CLD or analysis started referencing one of them since it was checked
+            return {
+                'conflicts': sorted(self.variable_repo.get_variable_ids_in_use(self.db_session, deleted))
+            }, "Variables came into use while deleting; retry the request"
+        except Exception as e:
+            self.db_session.rollback()
+            return None, f"Error deleting variables: {str(e)}"
+        
+        return {
+            'results': results,
+            'deleted': len(deleted)
+        }, f"{len(deleted)} of {len(variable_ids)} variables deleted" 
\ No newline at end of file
@@ -1,11 +1,31 @@
 from flask import Blueprint, request, jsonify
-from ..viewmodels import CLDViewModel
+from ..viewmodels import CLDViewModel, JobViewModel
 from ..auth import verify_token
 from functools import wraps
 from .. import db
+from ..jobs import job_runner
 
 cld_routes = Blueprint('cld_routes', __name__)
 
+# Default length bound and time budget (seconds) for the feedback loop census
+DEFAULT_CENSUS_MAX_LENGTH = 8
+DEFAULT_CENSUS_TIME_BUDGET = 5.0
+# Archetype matches kept per POST /cld/<id>/archetypes when max_total is not given
+DEFAULT_ARCHETYPE_MAX_TOTAL = 1000
+# Default bounds of POST /analysis/preview, which analyzes the diagram in the request
+DEFAULT_PREVIEW_MAX_LENGTH = 8
+DEFAULT_PREVIEW_MAX_LOOPS = 1000
+DEFAULT_PREVIEW_TIME_BUDGET = 5.0
+# Largest diagram a preview accepts (request body bytes, variables, relationships)
+MAX_PREVIEW_BYTES = 1024 * 1024
+MAX_PREVIEW_VARIABLES = 500
+MAX_PREVIEW_RELATIONSHIPS = 5000
+# Query parameters that switch GET /clds to the paged response
+PAGE_PARAMS = ('limit', 'sort', 'prefix', 'cursor')
+# Page size when limit is not given, and the largest page allowed
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -21,6 +41,23 @@ def token_required(f):
         return f(user_id, *args, **kwargs)
     return decorated
 
+def _wants_async():
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+def _queue_analysis(user_id, cld_id, job_type, params):
+    """Queues an analysis job and answers 202 with the job to poll"""
+    job, message = JobViewModel(db.session).create_job(cld_id, user_id, job_type, params)
+    
+    if job is None:  # Error case - CLD not found
+        return jsonify({'message': message}), 404
+    
+    job_runner.submit(job['id'])
+    return jsonify({
+        'message': message,
+        'job_id': job['id'],
+        'status': job['status']
+    }), 202, {'Location': f"/jobs/{job['id']}"}
+
 @cld_routes.route('/cld', methods=['POST'])
 @token_required
 def create_cld(user_id):
@@ -55,6 +92,23 @@ def create_cld(user_id):
 @token_required
 def get_user_clds(user_id):
     view_model = CLDViewModel(db.session)
+    
+    # Paged listing: ?limit=&sort=name|-name|date|-date&prefix=&cursor=
+    if any(param in request.args for param in PAGE_PARAMS):
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        if limit <= 0 or limit > MAX_PAGE_SIZE:
+            return jsonify({'message': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+        page, message = view_model.get_user_clds_page(
+            user_id,
+            limit,
+            sort=request.args.get('sort'),
+            prefix=request.args.get('prefix'),
+            cursor=request.args.get('cursor')
+        )
+        if page is None:
+            return jsonify({'message': message}), 400
+        return jsonify({'message': message, **page}), 200
+    
     clds, message = view_model.get_user_clds(user_id)
     
     # Always return an array (even if empty) for consistent frontend handling
@@ -124,6 +178,10 @@ def update_cld_route(user_id, cld_id):
     if not cld:
         return jsonify({'message': message}), 404
     
+    # Stored loops the update could not maintain are recomputed in the background
+    if cld.get('reanalysis_job_id'):
+        job_runner.submit(cld['reanalysis_job_id'])
+    
     # Debug output to see what's being returned
     print(f"Update successful: {message}")
     print(f"Updated CLD: {cld}")
@@ -162,60 +220,229 @@ def identify_feedback_loops(user_id, cld_id):
             'feedback_loops': feedback_loops
         }), 200
     
+    # Optional search bounds: ?max_length=&max_loops=&time_budget= (seconds)
+    max_length = request.args.get('max_length', type=int)
+    max_loops = request.args.get('max_loops', type=int)
+    time_budget = request.args.get('time_budget', type=float)
+    if any(bound is not None and bound <= 0 for bound in (max_length, max_loops, time_budget)):
+        return jsonify({'message': 'max_length, max_loops and time_budget must be positive numbers'}), 400
+    
+    # ?async=1: run the analysis in the background and poll GET /jobs/<job_id>
+    if _wants_async():
+        return _queue_analysis(user_id, cld_id, 'feedback_loops', {
+            'max_length': max_length,
+            'max_loops': max_loops,
+            'time_budget': time_budget
+        })
+
     # POST request - analyze and identify feedback loops
     try:
         print(f"Identifying feedback loops for CLD {cld_id}")
-        loops, message = view_model.identify_feedback_loops(cld_id, user_id)
+        result, message = view_model.identify_feedback_loops(
+            cld_id,
+            user_id,
+            max_length=max_length,
+            max_loops=max_loops,
+            time_budget=time_budget
+        )
         
-        if loops is None:  # Error case - CLD not found
+        if result is None:  # Error case - CLD not found
             print(f"Error identifying feedback loops: {message}")
             return jsonify({'message': message}), 404
         
-        print(f"Successfully identified {len(loops)} feedback loops")
+        print(f"Successfully identified {len(result['feedback_loops'])} feedback loops")
         # Return empty array with 200 status if no feedback loops (instead of 404)
         return jsonify({
             'message': message,
-            'feedback_loops': loops
+            'feedback_loops': result['feedback_loops'],
+            'truncated': result['truncated']
         }), 200
     except Exception as e:
         print(f"Exception in feedback loops endpoint: {str(e)}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
+@cld_routes.route('/cld/<cld_id>/feedback-loops/census', methods=['GET'])
+@token_required
+def feedback_loop_census(user_id, cld_id):
+    # Loops are counted up to ?max_length= variables; nothing is persisted
+    max_length = request.args.get('max_length', DEFAULT_CENSUS_MAX_LENGTH, type=int)
+    time_budget = request.args.get('time_budget', DEFAULT_CENSUS_TIME_BUDGET, type=float)
+    if max_length <= 0 or time_budget <= 0:
+        return jsonify({'message': 'max_length and time_budget must be positive numbers'}), 400
+    
+    view_model = CLDViewModel(db.session)
+    census, message = view_model.get_feedback_loop_census(cld_id, user_id, max_length, time_budget)
+    
+    if census is None:  # Error case - CLD not found
+        return jsonify({'message': message}), 404
+    
+    return jsonify({
+        'message': message,
+        'census': census
+    }), 200
+
+@cld_routes.route('/cld/<cld_id>/motifs', methods=['GET'])
+@token_required
+def motif_census(user_id, cld_id):
+    view_model = CLDViewModel(db.session)
+    census, message = view_model.get_motif_census(cld_id, user_id)
+    
+    if census is None:  # Error case - CLD not found
+        return jsonify({'message': message}), 404
+    
+    return jsonify({
+        'message': message,
+        **census
+    }), 200
+
 @cld_routes.route('/cld/<cld_id>/archetypes', methods=['POST', 'GET'])
 @token_required
 def identify_archetypes(user_id, cld_id):
     view_model = CLDViewModel(db.session)
     
+    # Optional page size: ?limit=&cursor= (id of the last archetype already received)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if limit is not None and limit <= 0:
+        return jsonify({'message': 'limit must be a positive integer'}), 400
+    
     # For GET requests, retrieve existing archetypes without re-analyzing
     if request.method == 'GET':
-        cld, get_message = view_model.get_cld(cld_id, user_id)
+        result, get_message = view_model.get_archetypes(cld_id, user_id, limit=limit, cursor=cursor)
         
-        if cld is None:  # Error case - CLD not found
+        if result is None:  # Error case - CLD not found
             return jsonify({'message': get_message}), 404
-            
-        # Extract archetypes from the CLD data
-        archetypes = cld.get('archetypes', [])
         
         return jsonify({
-            'message': "Archetypes retrieved successfully",
-            'archetypes': archetypes
+            'message': get_message,
+            'archetypes': result['archetypes'],
+            'next_cursor': result['next_cursor']
         }), 200
+    
+    # Optional match limits: ?max_per_type=&max_total=
+    max_per_type = request.args.get('max_per_type', type=int)
+    max_total = request.args.get('max_total', DEFAULT_ARCHETYPE_MAX_TOTAL, type=int)
+    if any(bound is not None and bound <= 0 for bound in (max_per_type, max_total)):
+        return jsonify({'message': 'max_per_type and max_total must be positive integers'}), 400
+    
+    # ?async=1: run the analysis in the background and poll GET /jobs/<job_id>
+    if _wants_async():
+        return _queue_analysis(user_id, cld_id, 'archetypes', {
+            'max_per_type': max_per_type,
+            'max_total': max_total,
+            'limit': limit
+        })
         
     # POST request - analyze and identify archetypes
     try:
         print(f"Identifying archetypes for CLD {cld_id}")
-        archetypes, message = view_model.identify_archetypes(cld_id, user_id)
+        result, message = view_model.identify_archetypes(
+            cld_id,
+            user_id,
+            max_per_type=max_per_type,
+            max_total=max_total,
+            limit=limit
+        )
         
-        if archetypes is None:  # Error case - CLD not found
+        if result is None:  # Error case - CLD not found
             print(f"Error identifying archetypes: {message}")
             return jsonify({'message': message}), 404
         
-        print(f"Successfully identified {len(archetypes)} archetypes")
+        print(f"Successfully identified {len(result['archetypes'])} archetypes")
         # Return empty array with 200 status if no archetypes (instead of 404)
         return jsonify({
             'message': message,
-            'archetypes': archetypes
+            'archetypes': result['archetypes'],
+            'truncated': result['truncated'],
+            'next_cursor': result['next_cursor']
         }), 200
     except Exception as e:
         print(f"Exception in archetypes endpoint: {str(e)}")
-        return jsonify({'message': f"Server error: {str(e)}"}), 500 
\ No newline at end of file
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
+
+@cld_routes.route('/cld/<cld_id>/analysis', methods=['POST'])
+@token_required
+def analyze_cld(user_id, cld_id):
+    # Same optional bounds as the separate feedback loop and archetype endpoints
+    max_length = request.args.get('max_length', type=int)
+    max_loops = request.args.get('max_loops', type=int)
+    time_budget = request.args.get('time_budget', type=float)
+    max_per_type = request.args.get('max_per_type', type=int)
+    max_total = request.args.get('max_total', DEFAULT_ARCHETYPE_MAX_TOTAL, type=int)
+    if any(bound is not None and bound <= 0 for bound in (max_length, max_loops, time_budget, max_per_type, max_total)):
+        return jsonify({
+            'message': 'max_length, max_loops, time_budget, max_per_type and max_total must be positive numbers'
+        }), 400
+    
+    params = {
+        'max_length': max_length,
+        'max_loops': max_loops,
+        'time_budget': time_budget,
+        'max_per_type': max_per_type,
+        'max_total': max_total
+    }
+    
+    # ?async=1: run the analysis in the background and poll GET /jobs/<job_id>
+    if _wants_async():
+        return _queue_analysis(user_id, cld_id, 'analysis', params)
+    
+    try:
+        print(f"Analyzing CLD {cld_id}")
+        view_model = CLDViewModel(db.session)
+        result, message = view_model.analyze_cld(cld_id, user_id, **params)
+        
+        if result is None:  # Error case - CLD not found
+            print(f"Error analyzing CLD: {message}")
+            return jsonify({'message': message}), 404
+        
+        print(f"Analyzed CLD {cld_id} in {sum(result['timings'].values()):.1f} ms")
+        return jsonify({
+            'message': message,
+            **result
+        }), 200
+    except Exception as e:
+        print(f"Exception in analysis endpoint: {str(e)}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
+
+@cld_routes.route('/analysis/preview', methods=['POST'])
+@token_required
+def preview_analysis(user_id):
+    if request.content_length is not None and request.content_length > MAX_PREVIEW_BYTES:
+        return jsonify({'message': f'Preview payloads are limited to {MAX_PREVIEW_BYTES} bytes'}), 413
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'variables' not in data or 'relationships' not in data:
+        return jsonify({'message': 'Missing required fields. Need: variables and relationships'}), 400
+    if isinstance(data['variables'], list) and len(data['variables']) > MAX_PREVIEW_VARIABLES:
+        return jsonify({'message': f'Previews are limited to {MAX_PREVIEW_VARIABLES} variables'}), 413
+    if isinstance(data['relationships'], list) and len(data['relationships']) > MAX_PREVIEW_RELATIONSHIPS:
+        return jsonify({'message': f'Previews are limited to {MAX_PREVIEW_RELATIONSHIPS} relationships'}), 413
+    
+    # Same optional bounds as the persisted analyses, but the loop search is always bounded
+    max_length = request.args.get('max_length', DEFAULT_PREVIEW_MAX_LENGTH, type=int)
+    max_loops = request.args.get('max_loops', DEFAULT_PREVIEW_MAX_LOOPS, type=int)
+    time_budget = request.args.get('time_budget', DEFAULT_PREVIEW_TIME_BUDGET, type=float)
+    max_per_type = request.args.get('max_per_type', type=int)
+    max_total = request.args.get('max_total', DEFAULT_ARCHETYPE_MAX_TOTAL, type=int)
+    if any(bound is not None and bound <= 0 for bound in (max_length, max_loops, time_budget, max_per_type, max_total)):
+        return jsonify({
+            'message': 'max_length, max_loops, time_budget, max_per_type and max_total must be positive numbers'
+        }), 400
+    
+    view_model = CLDViewModel(db.session)
+    result, message = view_model.preview_analysis(
+        data['variables'],
+        data['relationships'],
+        max_length=max_length,
+        max_loops=max_loops,
+        time_budget=time_budget,
+        max_per_type=max_per_type,
+        max_total=max_total
+    )
+    
+    if result is None:  # Error case - invalid diagram
+        return jsonify({'message': message}), 400
+    
+    return jsonify({
+        'message': message,
+        **result
+    }), 200
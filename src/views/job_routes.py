@@ -0,0 +1,36 @@
+from flask import Blueprint, request, jsonify
+from ..viewmodels import JobViewModel
+from ..auth import verify_token
+from functools import wraps
+from .. import db
+
+job_routes = Blueprint('job_routes', __name__)
+
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization')
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 401
+        try:
+            user_id = verify_token(token)
+            if not user_id:
+                return jsonify({'message': 'Invalid Token'}), 401
+        except:
+            return jsonify({'message': 'Token is invalid!'}), 401
+        return f(user_id, *args, **kwargs)
+    return decorated
+
+@job_routes.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_job(user_id, job_id):
+    view_model = JobViewModel(db.session)
+    job, message = view_model.get_job(job_id, user_id)
+    
+    if job is None:  # Error case - job not found
+        return jsonify({'message': message}), 404
+    
+    return jsonify({
+        'message': message,
+        'job': job
+    }), 200
@@ -1,11 +1,20 @@
 from flask import Blueprint, request, jsonify
 from ..viewmodels import VariableViewModel
+from ..viewmodels.variable_viewmodel import NAME_TAKEN, USER_NOT_FOUND
 from ..auth import verify_token
 from functools import wraps
 from .. import db
 
 variable_routes = Blueprint('variable_routes', __name__)
 
+# Query parameters that switch GET /variables to the paged response
+PAGE_PARAMS = ('limit', 'sort', 'prefix', 'cursor')
+# Page size when limit is not given, and the largest page allowed
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Items accepted by one /variables/bulk request
+MAX_BULK_ITEMS = 1000
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -35,7 +44,8 @@ def create_new_variable(user_id):
     variable, message = view_model.create_variable(user_id, name, description)
     
     if not variable:
-        return jsonify({'message': message}), 400
+        status = {NAME_TAKEN: 409, USER_NOT_FOUND: 404}.get(message, 400)
+        return jsonify({'message': message}), status
 
     return jsonify({'message': message}), 201
 
@@ -43,6 +53,23 @@ def create_new_variable(user_id):
 @token_required
 def get_variables(user_id):
     view_model = VariableViewModel(db.session)
+    
+    # Paged listing: ?limit=&sort=name|-name&prefix=&cursor=
+    if any(param in request.args for param in PAGE_PARAMS):
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        if limit <= 0 or limit > MAX_PAGE_SIZE:
+            return jsonify({'message': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+        page, message = view_model.get_user_variables_page(
+            user_id,
+            limit,
+            sort=request.args.get('sort'),
+            prefix=request.args.get('prefix'),
+            cursor=request.args.get('cursor')
+        )
+        if page is None:
+            return jsonify({'message': message}), 400
+        return jsonify({'message': message, **page}), 200
+    
     variables, message = view_model.get_user_variables(user_id)
     
     if not variables:
@@ -50,6 +77,36 @@ def get_variables(user_id):
         
     return jsonify(variables), 200
 
+@variable_routes.route('/variables/bulk', methods=['POST', 'PUT', 'DELETE'])
+@token_required
+def bulk_variables(user_id):
+    data = request.get_json(silent=True) or {}
+    key = 'ids' if request.method == 'DELETE' else 'variables'
+    items = data.get(key)
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': f"Bad Request: '{key}' must be a non-empty list"}), 400
+    if len(items) > MAX_BULK_ITEMS:
+        return jsonify({'message': f"At most {MAX_BULK_ITEMS} items per request"}), 400
+    
+    view_model = VariableViewModel(db.session)
+    if request.method == 'POST':
+        result, message = view_model.create_variables(user_id, items)
+    elif request.method == 'PUT':
+        result, message = view_model.update_variables(user_id, items)
+    else:
+        if not all(isinstance(item, str) for item in items):
+            return jsonify({'message': "Bad Request: 'ids' must be a list of variable ids"}), 400
+        result, message = view_model.delete_variables(user_id, items)
+    
+    if result is None:
+        return jsonify({'message': message}), 500
+    if 'conflicts' in result:
+        # A concurrent request changed the variables between the check and the write
+        return jsonify({'message': message, 'conflicts': result['conflicts']}), 409
+    
+    # Per-item outcomes are in results; the request itself succeeded
+    return jsonify({'message': message, **result}), 200
+
 @variable_routes.route('/variable/<variable_id>', methods=['PUT'])
 @token_required
 def update_variable_route(user_id, variable_id):
@@ -67,7 +124,7 @@ def update_variable_route(user_id, variable_id):
     variable, message = view_model.update_variable(variable_id, user_id, name, description)
     
     if not variable:
-        return jsonify({'message': message}), 404
+        return jsonify({'message': message}), 409 if message == NAME_TAKEN else 404
         
     return jsonify({
         'message': message,